@@ -1,80 +1,288 @@
 from queue import Queue
-from collections import namedtuple
+from collections import OrderedDict, defaultdict, deque, namedtuple
+from collections.abc import MutableSequence
+from array import array
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from itertools import compress
+from operator import itemgetter
+import argparse
+import asyncio
+import bisect
+import contextlib
+import functools
+import gc
+import heapq
+import inspect
+import itertools
 import json
+import math
+import mmap
+import multiprocessing
 import os
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import urllib.parse
+import uuid
+import zlib
+
+#Money is kept as integer cents. Prices come in as currency units (float, int, str or
+#Decimal) and are rounded half up to the cent once, when the item is created.
+#NaN, infinities and unparseable strings raise ValueError.
+def to_cents(amount) -> int:
+    if isinstance(amount, int):
+        return amount * 100
+    if isinstance(amount, float):
+        if not math.isfinite(amount):
+            raise ValueError(f"Amount must be a finite number, not {amount!r}.")
+        cents = round(amount * 100)
+        if cents / 100 == amount:
+            return cents
+        amount = repr(amount)
+    try:
+        value = Decimal(str(amount))
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount {amount!r}.") from None
+    if not value.is_finite():
+        raise ValueError(f"Amount must be a finite number, not {amount!r}.")
+    return int(value.scaleb(2).to_integral_value(ROUND_HALF_UP))
+
+def from_cents(cents: int) -> float:
+    return cents / 100
+
+#Percent discounts are kept to hundredths of a percent and rounded half up to the cent.
+def percent_of(cents: int, percent: float) -> int:
+    basis_points = round(percent * 100)
+    return (cents * basis_points + 5000) // 10000
+
+#Metrics: counters, gauges and latency histograms, exported in the Prometheus text
+#format. Collection is off until enabled; while off, a timed function costs one
+#attribute check and every count/observe call returns right away.
+class Metrics:
+    BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+    def __init__(self, prefix: str = "restaurant", enabled: bool = False):
+        self.prefix = prefix
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = defaultdict(int)
+        self.gauges = {}
+        # name -> [count per bucket (last one is +Inf), sum, count]
+        self.histograms = {}
+
+    def count(self, name: str, amount: int = 1):
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += amount
+
+    def set(self, name: str, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = [[0] * (len(self.BUCKETS) + 1), 0.0, 0]
+            histogram[0][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            histogram[1] += seconds
+            histogram[2] += 1
+
+    def timed(self, name: str):
+        def decorate(function):
+            if inspect.iscoroutinefunction(function):
+                @functools.wraps(function)
+                async def timed_coroutine(*args, **kwargs):
+                    if not self.enabled:
+                        return await function(*args, **kwargs)
+                    start = time.perf_counter()
+                    try:
+                        return await function(*args, **kwargs)
+                    finally:
+                        self.observe(name, time.perf_counter() - start)
+                return timed_coroutine
+            @functools.wraps(function)
+            def timed_function(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.observe(name, time.perf_counter() - start)
+            return timed_function
+        return decorate
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def render(self) -> str:
+        lines = []
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted((name, ([*buckets], total, n)) for name, (buckets, total, n) in self.histograms.items())
+        for kind, values in (("counter", counters), ("gauge", gauges)):
+            for name, value in values:
+                lines.append(f"# TYPE {self.prefix}_{name} {kind}")
+                lines.append(f"{self.prefix}_{name} {value}")
+        for name, (buckets, total, n) in histograms:
+            name = f"{self.prefix}_{name}"
+            lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, bucket in zip(self.BUCKETS + ("+Inf",), buckets):
+                cumulative += bucket
+                lines.append(f'{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f"{name}_sum {total}")
+            lines.append(f"{name}_count {n}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def export(self, filename="metrics.prom"):
+        temp_filename = filename + ".tmp"
+        with open(temp_filename, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(temp_filename, filename)
+
+metrics = Metrics()
+
+def _rebuild_item(cls, values):
+    item = object.__new__(cls)
+    for field, value in zip(cls._fields, values):
+        object.__setattr__(item, field, value)
+    return item
+
+#Items are slotted and immutable so menus and orders can share them safely.
+#The set_ methods return an updated copy instead of changing the item in place.
+#An item's text is rendered once and kept in the line slot; the copies made by
+#the setters start without it, so a changed item is always rendered fresh.
+#prep_time is how many seconds the kitchen needs for the item; items without one
+#take their category's default_prep_time.
+class MenuItem:
+    __slots__ = ("name", "price_cents", "is_vegan", "prep_time", "line")
+    _fields = ("name", "price_cents", "is_vegan", "prep_time")
+    default_prep_time = 120.0
 
-Menu = namedtuple("Menu", ["name", "items"])
+    def __init__(self, name: str, price: float, is_vegan: bool = False, prep_time: float = None):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "price_cents", to_cents(price))
+        object.__setattr__(self, "is_vegan", is_vegan)
+        object.__setattr__(self, "prep_time", float(self.default_prep_time if prep_time is None else prep_time))
 
-class MenuItem:
-    def __init__(self, name: str, price: float, is_vegan: bool = False):
-        self.name = name
-        self.price = price
-        self.is_vegan = is_vegan
+    @property
+    def price(self) -> float:
+        return from_cents(self.price_cents)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable, use set_{name}() to get an updated copy")
+
+    def __delattr__(self, name):
+        raise AttributeError(f"{self.__class__.__name__} is immutable")
+
+    def __reduce__(self):
+        return _rebuild_item, (self.__class__, tuple(getattr(self, field) for field in self._fields))
+
+    def _replace(self, **changes):
+        values = tuple(changes.get(field, getattr(self, field)) for field in self._fields)
+        return _rebuild_item(self.__class__, values)
+
+    def __str__(self):
+        try:
+            return self.line
+        except AttributeError:
+            line = self.render()
+            object.__setattr__(self, "line", line)
+            return line
+
+    def render(self) -> str:
+        return f"{self.__class__.__name__}: {self.name}, Price: {self.price}"
 
     def get_name(self):
         return self.name
 
     def set_name(self, name: str):
-        self.name = name
+        return self._replace(name=name)
 
     def get_price(self):
         return self.price
 
     def set_price(self, price: float):
-        self.price = price
+        return self._replace(price_cents=to_cents(price))
 
     def get_is_vegan(self):
         return self.is_vegan
 
     def set_is_vegan(self, is_vegan: bool):
-        self.is_vegan = is_vegan
+        return self._replace(is_vegan=is_vegan)
 
     def is_vegan_item(self):
         return self.is_vegan
 
+    def get_prep_time(self):
+        return self.prep_time
+
+    def set_prep_time(self, prep_time: float):
+        return self._replace(prep_time=float(prep_time))
+
     def to_dict(self):
         return {
             "name": self.name,
             "price": self.price,
             "is_vegan": self.is_vegan,
+            "prep_time": self.prep_time,
             "type": self.__class__.__name__
         }
 
 
 class Appetizer(MenuItem):
-    def __init__(self, name: str, price: float):
-        super().__init__(name, price)
+    __slots__ = ()
+    default_prep_time = 240.0
 
-    def __str__(self):
+    def __init__(self, name: str, price: float, prep_time: float = None):
+        super().__init__(name, price, prep_time=prep_time)
+
+    def render(self) -> str:
         return f"Appetizer: {self.name}, Price: {self.price}"
 
 
 class MainCourse(MenuItem):
-    def __init__(self, name: str, price: float, protein: str, grains: str, vegetables: str):
-        super().__init__(name, price)
-        self.protein = protein
-        self.grains = grains
-        self.vegetables = vegetables
+    __slots__ = ("protein", "grains", "vegetables")
+    _fields = MenuItem._fields + __slots__
+    default_prep_time = 600.0
+
+    def __init__(self, name: str, price: float, protein: str, grains: str, vegetables: str,
+                 prep_time: float = None):
+        super().__init__(name, price, prep_time=prep_time)
+        object.__setattr__(self, "protein", protein)
+        object.__setattr__(self, "grains", grains)
+        object.__setattr__(self, "vegetables", vegetables)
 
     def get_protein(self):
         return self.protein
 
     def set_protein(self, protein: str):
-        self.protein = protein
+        return self._replace(protein=protein)
 
     def get_grains(self):
         return self.grains
 
     def set_grains(self, grains: str):
-        self.grains = grains
+        return self._replace(grains=grains)
 
     def get_vegetables(self):
         return self.vegetables
 
     def set_vegetables(self, vegetables: str):
-        self.vegetables = vegetables
+        return self._replace(vegetables=vegetables)
 
-    def __str__(self):
+    def render(self) -> str:
         return (f"Main Course: {self.name}, Price: {self.price}, "
                 f"Protein: {self.protein}, Grains: {self.grains}, Vegetables: {self.vegetables}")
 
@@ -89,24 +297,28 @@ class MainCourse(MenuItem):
 
 
 class Beverage(MenuItem):
-    def __init__(self, name: str, price: float, size: str, beverage_type: str):
-        super().__init__(name, price)
-        self.size = size
-        self.beverage_type = beverage_type
+    __slots__ = ("size", "beverage_type")
+    _fields = MenuItem._fields + __slots__
+    default_prep_time = 60.0
+
+    def __init__(self, name: str, price: float, size: str, beverage_type: str, prep_time: float = None):
+        super().__init__(name, price, prep_time=prep_time)
+        object.__setattr__(self, "size", size)
+        object.__setattr__(self, "beverage_type", beverage_type)
 
     def get_size(self):
         return self.size
 
     def set_size(self, size: str):
-        self.size = size
+        return self._replace(size=size)
 
     def get_beverage_type(self):
         return self.beverage_type
 
     def set_beverage_type(self, beverage_type: str):
-        self.beverage_type = beverage_type
+        return self._replace(beverage_type=beverage_type)
 
-    def __str__(self):
+    def render(self) -> str:
         return (f"Beverage: {self.name}, Price: {self.price}, "
                 f"Size: {self.size}, Type: {self.beverage_type}")
 
@@ -120,77 +332,541 @@ class Beverage(MenuItem):
 
 
 class Dessert(MenuItem):
-    def __init__(self, name: str, price: float):
-        super().__init__(name, price)
+    __slots__ = ()
+    default_prep_time = 180.0
 
-    def __str__(self):
+    def __init__(self, name: str, price: float, prep_time: float = None):
+        super().__init__(name, price, prep_time=prep_time)
+
+    def render(self) -> str:
         return f"Dessert: {self.name}, Price: {self.price}"
 
 
+CATEGORIES = (Appetizer, MainCourse, Beverage, Dessert)
+
+PROMOTION_TARGETS = ("order",) + tuple(category.__name__ for category in CATEGORIES)
+PROMOTION_STACKING = ("stack", "exclusive")
+
+#discount1: 10% for 15 items, 0.5% for each additional item, max 30%
+#discount2: 50% on beverages (applied later) for more than 3 main courses
+DEFAULT_PROMOTIONS = [
+    {"name": "Volume discount", "target": "order", "when": {"items": 16},
+     "percent": 10, "per_item": 0.5, "per_item_after": 15, "cap": 30},
+    {"name": "Half price beverages", "target": "Beverage", "when": {"MainCourse": 4},
+     "percent": 50},
+]
+
+#Promotions are plain data (promotions.json). The engine validates them once and
+#compiles them into a single generated function, so evaluating hundreds of rules is a
+#chain of integer comparisons. Rules run from the highest priority down: a "stack"
+#rule adds its percent to its target, an "exclusive" rule only applies when nothing
+#else on its target has yet, and then closes that target to lower priority rules.
+class PromotionEngine:
+    def __init__(self, rules: list[dict]):
+        self.rules = [self.validate(rule) for rule in rules]
+        self.source = self.generate(self.rules)
+        namespace = {}
+        exec(compile(self.source, "<promotions>", "exec"), namespace)
+        self.evaluate = namespace["evaluate"]
+
+    @staticmethod
+    def validate(rule: dict) -> dict:
+        name = str(rule.get("name", "unnamed promotion"))
+        if rule.get("target") not in PROMOTION_TARGETS:
+            raise ValueError(f"Promotion '{name}' has an unknown target {rule.get('target')!r}.")
+        if rule.get("stacking", "stack") not in PROMOTION_STACKING:
+            raise ValueError(f"Promotion '{name}' has an unknown stacking {rule.get('stacking')!r}.")
+        when = {}
+        for counted, minimum in rule.get("when", {}).items():
+            if counted != "items" and counted not in PROMOTION_TARGETS[1:]:
+                raise ValueError(f"Promotion '{name}' has an unknown condition {counted!r}.")
+            when[counted] = int(minimum)
+        amounts = {"percent": float(rule["percent"]), "per_item": float(rule.get("per_item", 0.0)),
+                   "cap": float(rule.get("cap", 100.0))}
+        for field, value in amounts.items():
+            if not math.isfinite(value) or value < 0:
+                raise ValueError(f"Promotion '{name}' has an invalid {field} {value!r}, "
+                                 f"it must be a finite number of at least 0.")
+        return {
+            "name": name,
+            "target": rule["target"],
+            "when": when,
+            "percent": amounts["percent"],
+            "per_item": amounts["per_item"],
+            "per_item_after": int(rule.get("per_item_after", 0)),
+            "cap": amounts["cap"],
+            "priority": int(rule.get("priority", 0)),
+            "stacking": rule.get("stacking", "stack"),
+        }
+
+    @staticmethod
+    def generate(rules: list[dict]) -> str:
+        counters = {"items": "n"}
+        counters.update({category.__name__: f"c{code}" for code, category in enumerate(CATEGORIES)})
+        arguments = ", ".join(["n"] + [f"c{code}" for code in range(len(CATEGORIES))])
+        lines = [f"def evaluate({arguments}):"]
+        for t, target in enumerate(PROMOTION_TARGETS):
+            target_rules = sorted((rule for rule in rules if rule["target"] == target),
+                                  key=lambda rule: -rule["priority"])
+            # targets with only stacking rules need no open/fired bookkeeping
+            exclusive = any(rule["stacking"] == "exclusive" for rule in target_rules)
+            lines.append(f"    p{t} = 0.0; open{t} = True; fired{t} = False" if exclusive else f"    p{t} = 0.0")
+            stacked = False
+            for rule in target_rules:
+                conditions = [f"open{t}"] if exclusive else []
+                if rule["stacking"] == "exclusive" and stacked:
+                    conditions.append(f"not fired{t}")
+                # counts are never negative, so a minimum of 0 is no condition at all
+                conditions.extend(f"{counters[counted]} >= {minimum}"
+                                  for counted, minimum in rule["when"].items() if minimum > 0)
+                if rule["per_item"]:
+                    extra = "n" if rule["per_item_after"] <= 0 else f"max(0, n - {rule['per_item_after']})"
+                    percent = f"min({rule['cap']!r}, {rule['percent']!r} + {rule['per_item']!r} * {extra})"
+                else:
+                    percent = repr(min(rule["cap"], rule["percent"]))  # folded now, not per call
+                if rule["stacking"] == "exclusive":
+                    action = f"p{t} = {percent}; open{t} = False"
+                else:
+                    action = f"p{t} += {percent}; fired{t} = True" if exclusive else f"p{t} += {percent}"
+                    stacked = True
+                if conditions:
+                    lines.append(f"    if {' and '.join(conditions)}:  # {rule['name']!r}")
+                    lines.append(f"        {action}")
+                else:
+                    lines.append(f"    {action}  # {rule['name']!r}")
+        percents = ", ".join(f"min(p{t}, 100.0)" for t in range(len(PROMOTION_TARGETS)))
+        lines.append(f"    return ({percents})")
+        return "\n".join(lines) + "\n"
+
+    def percents(self, n_items: int, counts) -> tuple:
+        return self.evaluate(n_items, *counts)
+
+def load_promotions(filename="promotions.json") -> PromotionEngine:
+    try:
+        with open(filename, "r", encoding="utf-8") as f:
+            return PromotionEngine(json.load(f))
+    except FileNotFoundError:
+        return PromotionEngine(DEFAULT_PROMOTIONS)
+
+#percents are (order percent, then one percent per category in CATEGORIES order);
+#category discounts come off their subtotals first, then the order discount.
+def net_total(total_cents: int, subtotal_cents, percents) -> int:
+    for subtotal, percent in zip(subtotal_cents, percents[1:]):
+        if percent > 0:
+            total_cents -= percent_of(subtotal, percent)
+    if percents[0] > 0:
+        total_cents -= percent_of(total_cents, percents[0])
+    return total_cents
+
+#The same discounts as net_total, as amounts: the order discount first, then one per
+#category, so total_cents - sum(amounts) is always the bill.
+def discount_amounts(total_cents: int, subtotal_cents, percents) -> tuple:
+    category_amounts = tuple(percent_of(subtotal, percent) if percent > 0 else 0
+                             for subtotal, percent in zip(subtotal_cents, percents[1:]))
+    remaining = total_cents - sum(category_amounts)
+    return (percent_of(remaining, percents[0]) if percents[0] > 0 else 0,) + category_amounts
+
 class Order:
+    promotions = PromotionEngine(DEFAULT_PROMOTIONS)
+
     def __init__(self, items: list[MenuItem]):
-        self.items = items
+        self.items = []
+        self.cached_percents = None
+        self.receipt = None
+        # running totals per category so billing never rescans the items
+        self.counts = {category: 0 for category in CATEGORIES}
+        self.subtotal_cents = {category: 0 for category in CATEGORIES}
+        self.total_cents = 0
+        for item in items:
+            self.add_item(item)
 
     def add_item(self, item: MenuItem):
         self.items.append(item)
-    #discount1: 10% for 15 items, 0.5% for each additional item, max 30%
+        self.cached_percents = self.receipt = None
+        self.total_cents += item.price_cents
+        for category in CATEGORIES:
+            if isinstance(item, category):
+                self.counts[category] += 1
+                self.subtotal_cents[category] += item.price_cents
+                break
+
+    @property
+    def total_price(self) -> float:
+        return from_cents(self.total_cents)
+
+    @property
+    def subtotals(self) -> dict:
+        return {category: from_cents(cents) for category, cents in self.subtotal_cents.items()}
+
+    def percents(self) -> tuple:
+        if self.cached_percents is None:
+            self.cached_percents = self.promotions.percents(len(self.items), self.counts.values())
+        return self.cached_percents
+    #discount1: whole order discount, 10% for 15 items up to 30% with the default promotions
     def discount1(self) -> float:
-        n = len(self.items)
-        if n > 15:
-            extra_items = n - 15
-            discount_percent = 10 + (extra_items * 0.5)
-            if discount_percent > 30:
-                discount_percent = 30
-            return discount_percent
-        return 0.0
-    #discount2: 50% on beverages (applied later) for more than 3 main courses 
+        return self.percents()[0]
+    #discount2: beverage discount, 50% for more than 3 main courses with the default promotions
     def discount2(self) -> float:
-        main_courses = [item for item in self.items if isinstance(item, MainCourse)]
-        if len(main_courses) > 3:
-            return 50.0
-        return 0.0
+        return self.percents()[1 + CATEGORIES.index(Beverage)]
+
+    @metrics.timed("get_bill_seconds")
+    def get_bill_cents(self) -> int:
+        return net_total(self.total_cents, self.subtotal_cents.values(), self.percents())
 
     def get_bill(self) -> float:
-        total = 0.0
-        beverage_discount = self.discount2()
-        for item in self.items:
-            if isinstance(item, Beverage) and beverage_discount > 0:
-                total += item.price * 0.5  # 50% off
-            else:
-                total += item.price
-        discount_percent = self.discount1()
-        if discount_percent > 0:
-            total -= total * (discount_percent / 100)
-        return total
+        return from_cents(self.get_bill_cents())
+
+    def discount_cents(self) -> tuple:
+        return discount_amounts(self.total_cents, self.subtotal_cents.values(), self.percents())
 
     def __str__(self):
-        order_str = "Order\n-------------------\n"
-        for item in self.items:
-            order_str += str(item) + "\n"
-        order_str += f"-------------------\nBeverages: {len([item for item in self.items if isinstance(item, Beverage)])}\n"
-        order_str += f"-------------------\nBeverages Price: {sum(item.price for item in self.items if isinstance(item, Beverage))}\n"
-        order_str += f"-------------------\nAppetizers: {len([item for item in self.items if isinstance(item, Appetizer)])}\n"
-        order_str += f"-------------------\nAppetizers Price: {sum(item.price for item in self.items if isinstance(item, Appetizer))}\n"
-        order_str += f"-------------------\nMain Courses: {len([item for item in self.items if isinstance(item, MainCourse)])}\n"
-        order_str += f"-------------------\nMain Courses Price: {sum(item.price for item in self.items if isinstance(item, MainCourse))}\n"
-        order_str += f"-------------------\nDesserts: {len([item for item in self.items if isinstance(item, Dessert)])}\n"
-        order_str += f"-------------------\nDesserts Price: {sum(item.price for item in self.items if isinstance(item, Dessert))}\n"
-        order_str += f"-------------------\nTotal Items: {len(self.items)}\n"
-        order_str += f"-------------------\nTotal Price: {sum(item.price for item in self.items)}\n"
-        order_str += f"-------------------\nOverall Discount: {self.discount1()}%\n"
-        order_str += f"-------------------\nNet Total: {self.get_bill():.2f}\n-------------------"
-        return order_str
+        if self.receipt is None:
+            self.receipt = render_receipt(self)
+        return self.receipt
     
+#Receipts are built with one join and shared between orders with the same items (and
+#promotions), so printing an order at placement and again when served renders it once.
+RECEIPT_LABELS = ((Beverage, "Beverages"), (Appetizer, "Appetizers"),
+                  (MainCourse, "Main Courses"), (Dessert, "Desserts"))
+RECEIPT_RULE = "-------------------"
+receipt_cache = OrderedDict()
+receipt_cache_size = 1024
+
+def build_receipt(order: Order) -> str:
+    lines = ["Order", RECEIPT_RULE]
+    lines.extend(map(str, order.items))
+    for category, label in RECEIPT_LABELS:
+        lines += [RECEIPT_RULE, f"{label}: {order.counts[category]}",
+                  RECEIPT_RULE, f"{label} Price: {from_cents(order.subtotal_cents[category])}"]
+    lines += [RECEIPT_RULE, f"Total Items: {len(order.items)}",
+              RECEIPT_RULE, f"Total Price: {order.total_price}",
+              RECEIPT_RULE, f"Overall Discount: {order.discount1()}%",
+              RECEIPT_RULE, f"Net Total: {order.get_bill():.2f}",
+              RECEIPT_RULE]
+    return "\n".join(lines)
+
+def render_receipt(order: Order) -> str:
+    key = (order.promotions, tuple(order.items))
+    receipt = receipt_cache.get(key)
+    if receipt is None:
+        receipt = receipt_cache[key] = build_receipt(order)
+        if len(receipt_cache) > receipt_cache_size:
+            receipt_cache.popitem(last=False)
+    else:
+        receipt_cache.move_to_end(key)
+    return receipt
+
+#Batch billing: orders with the same item counts get the same percents, so a batch
+#evaluates the promotions once per distinct count vector and keeps that plan's basis
+#points ready; billing an order is then a few integer operations. Orders already carry
+#their running counts and subtotals, so bill_orders reads those; bill_encoded prices
+#flattened columns, counting codes in place and only summing discounted subtotals.
+CATEGORY_CODES = {category: code for code, category in enumerate(CATEGORIES)}
+BEVERAGE_CODE = CATEGORY_CODES[Beverage]
+CATEGORY_BYTES = tuple(bytes((code,)) for code in range(len(CATEGORIES)))
+
+BatchBill = namedtuple("BatchBill", ["discount1", "discount2", "totals_cents", "orders_per_second"])
+
+def category_code(item: MenuItem) -> int:
+    code = CATEGORY_CODES.get(type(item))
+    if code is None:
+        for category in CATEGORIES:
+            if isinstance(item, category):
+                return CATEGORY_CODES[category]
+        return -1
+    return code
+
+def encode_orders(orders) -> tuple[array, array, array]:
+    codes = array("b")
+    prices = array("q")
+    offsets = array("q", [0])
+    for order in orders:
+        codes.extend(map(category_code, order.items))
+        prices.extend(item.price_cents for item in order.items)
+        offsets.append(len(codes))
+    return codes, prices, offsets
+
+def billing_plan(promotions: PromotionEngine, key: tuple) -> tuple:
+    # the percents, the (code, basis points) of each discounted category and the
+    # order's basis points; applied as in net_total, so the cents match get_bill_cents
+    percents = promotions.evaluate(*key)
+    categories = tuple((code, round(percent * 100)) for code, percent in enumerate(percents[1:]) if percent > 0)
+    return percents, categories, round(percents[0] * 100) if percents[0] > 0 else 0
+
+def bill_encoded(codes: array, prices: array, offsets: array,
+                 promotions: PromotionEngine = None) -> tuple[array, array, array]:
+    promotions = promotions or Order.promotions
+    column = codes.tobytes()
+    prices = memoryview(prices)
+    masks = {}
+    plans = {}
+    discounts1, discounts2, totals = [], [], []
+    for lo, hi in zip(offsets, offsets[1:]):
+        key = (hi - lo, *map(column.count, CATEGORY_BYTES, (lo,) * len(CATEGORIES), (hi,) * len(CATEGORIES)))
+        plan = plans.get(key)
+        if plan is None:
+            plan = plans[key] = billing_plan(promotions, key)
+        percents, categories, order_points = plan
+        total_cents = sum(prices[lo:hi])
+        for code, points in categories:
+            mask = masks.get(code)
+            if mask is None:
+                mask = masks[code] = column.translate(bytes(int(byte == code) for byte in range(256)))
+            total_cents -= (sum(compress(prices[lo:hi], mask[lo:hi])) * points + 5000) // 10000
+        if order_points:
+            total_cents -= (total_cents * order_points + 5000) // 10000
+        discounts1.append(percents[0])
+        discounts2.append(percents[1 + BEVERAGE_CODE])
+        totals.append(total_cents)
+    return array("d", discounts1), array("d", discounts2), array("q", totals)
+
+def bill_orders(orders, promotions: PromotionEngine = None) -> BatchBill:
+    start = time.perf_counter()
+    promotions = promotions or Order.promotions
+    plans = {}
+    discounts1, discounts2, totals = [], [], []
+    for order in orders:
+        key = (len(order.items), *order.counts.values())
+        plan = plans.get(key)
+        if plan is None:
+            plan = plans[key] = billing_plan(promotions, key)
+        percents, categories, order_points = plan
+        total_cents = order.total_cents
+        if categories:
+            subtotals = tuple(order.subtotal_cents.values())
+            for code, points in categories:
+                total_cents -= (subtotals[code] * points + 5000) // 10000
+        if order_points:
+            total_cents -= (total_cents * order_points + 5000) // 10000
+        discounts1.append(percents[0])
+        discounts2.append(percents[1 + BEVERAGE_CODE])
+        totals.append(total_cents)
+    elapsed = time.perf_counter() - start
+    rate = len(totals) / elapsed if elapsed > 0 else float("inf")
+    return BatchBill(array("d", discounts1), array("d", discounts2), array("q", totals), rate)
+
+MENU_LISTING_STYLES = {
+    "modify": " {number}) {key}: {item}\n",
+    "order": "{number}) {key} - {item}",
+}
+
+#Menu items keep secondary indexes (type, vegan flag, price, ingredients and beverage
+#attributes) up to date on every insert and delete, so queries never scan the menu.
+class IndexedItems(dict):
+    def __init__(self, items=()):
+        super().__init__()
+        self.version = 0  # bumped on every change, used to invalidate cached renderings
+        self.listings = {}
+        self.reset_indexes()
+        self.update(items)
+
+    def listing(self, style: str) -> str:
+        # whole-menu listings are cached per style and rebuilt when the version changes
+        cached = self.listings.get(style)
+        if cached is None or cached[0] != self.version:
+            template = MENU_LISTING_STYLES[style]
+            text = "\n".join(template.format(number=number, key=key, item=item)
+                             for number, (key, item) in enumerate(self.items(), 1))
+            cached = self.listings[style] = (self.version, text)
+        return cached[1]
+
+    def reset_indexes(self):
+        self.by_category = defaultdict(set)
+        self.by_vegan = {True: set(), False: set()}
+        self.by_price = []  # sorted (price in cents, key) pairs
+        self.by_ingredient = defaultdict(set)
+        self.by_size = defaultdict(set)
+        self.by_beverage_type = defaultdict(set)
+
+    def index_sets(self, item):
+        sets = [self.by_vegan[bool(item.is_vegan)]]
+        code = category_code(item)
+        if code >= 0:
+            sets.append(self.by_category[CATEGORIES[code]])
+        if isinstance(item, MainCourse):
+            sets.extend(self.by_ingredient[value.lower()]
+                        for value in (item.protein, item.grains, item.vegetables))
+        elif isinstance(item, Beverage):
+            sets.append(self.by_size[item.size.lower()])
+            sets.append(self.by_beverage_type[item.beverage_type.lower()])
+        return sets
+
+    def index(self, key, sets, price):
+        for index in sets:
+            index.add(key)
+        bisect.insort(self.by_price, price)
+
+    def unindex(self, key, item):
+        for index in self.index_sets(item):
+            index.discard(key)
+        position = bisect.bisect_left(self.by_price, (item.price_cents, key))
+        del self.by_price[position]
+
+    def __setitem__(self, key, item):
+        # found before anything changes, so an item that can't be indexed leaves the
+        # mapping and its indexes exactly as they were
+        sets, price = self.index_sets(item), (item.price_cents, key)
+        if key in self:
+            self.unindex(key, self[key])
+        super().__setitem__(key, item)
+        self.index(key, sets, price)
+        self.version += 1
+
+    def __delitem__(self, key):
+        self.unindex(key, self[key])
+        super().__delitem__(key)
+        self.version += 1
+
+    def pop(self, key, *default):
+        if key in self:
+            item = self[key]
+            del self[key]
+            return item
+        if default:
+            return default[0]
+        raise KeyError(key)
+
+    def popitem(self):
+        key, item = super().popitem()
+        self.unindex(key, item)
+        self.version += 1
+        return key, item
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        # bulk loads append to the price index and sort it once instead of an insort per item
+        items = dict(*args, **kwargs)
+        if not items:
+            return
+        indexed = [(key, item, self.index_sets(item), (item.price_cents, key)) for key, item in items.items()]
+        replaced = {key for key in items if key in self}
+        if replaced:
+            for key in replaced:
+                for index in self.index_sets(self[key]):
+                    index.discard(key)
+            self.by_price = [pair for pair in self.by_price if pair[1] not in replaced]
+        for key, item, sets, price in indexed:
+            super().__setitem__(key, item)
+            for index in sets:
+                index.add(key)
+            self.by_price.append(price)
+        self.by_price.sort()
+        self.version += 1
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def clear(self):
+        super().clear()
+        self.reset_indexes()
+        self.version += 1
+
+    def query(self, category=None, vegan=None, min_price=None, max_price=None,
+              ingredient=None, size=None, beverage_type=None) -> dict:
+        candidates = []
+        if category is not None:
+            candidates.append(self.by_category.get(category, set()))
+        if vegan is not None:
+            candidates.append(self.by_vegan[bool(vegan)])
+        if ingredient is not None:
+            candidates.append(self.by_ingredient.get(ingredient.lower(), set()))
+        if size is not None:
+            candidates.append(self.by_size.get(size.lower(), set()))
+        if beverage_type is not None:
+            candidates.append(self.by_beverage_type.get(beverage_type.lower(), set()))
+        if min_price is not None or max_price is not None:
+            lo = 0 if min_price is None else bisect.bisect_left(self.by_price, to_cents(min_price), key=itemgetter(0))
+            hi = len(self.by_price) if max_price is None else bisect.bisect_right(self.by_price, to_cents(max_price), key=itemgetter(0))
+            if not candidates:
+                return {key: self[key] for _, key in self.by_price[lo:hi]}
+            candidates.append({key for _, key in self.by_price[lo:hi]})
+        if not candidates:
+            return dict(self)
+        candidates.sort(key=len)
+        keys = candidates[0].intersection(*candidates[1:])
+        return {key: self[key] for key in keys}
+
+class Menu(namedtuple("Menu", ["name", "items"])):
+    __slots__ = ()
+
+    def __new__(cls, name: str, items):
+        if not isinstance(items, IndexedItems):
+            items = IndexedItems(items)
+        return super().__new__(cls, name, items)
+
+    def query(self, **filters) -> dict:
+        return self.items.query(**filters)
+
+PaymentResult = namedtuple("PaymentResult", ["status", "amount", "change", "message"])
+
+#Processors settle charges. Every charge carries an idempotency key that stays the
+#same across retries, so a retried charge is never settled twice.
+class PaymentProcessor:
+    async def charge(self, key: str, method: str, amount_cents: int):
+        raise NotImplementedError("charge() should be implemented in subclasses.")
+
+class FakeProcessor(PaymentProcessor):
+    def __init__(self, latency: float = 0.0, failure_rate: float = 0.0, seed=None,
+                 remembered_keys: int = 100_000):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        # only the most recent keys are remembered, like a real processor's dedup window
+        self.settled = OrderedDict()
+        self.remembered_keys = remembered_keys
+
+    async def charge(self, key: str, method: str, amount_cents: int):
+        if key in self.settled:
+            return
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.random.random() < self.failure_rate:
+            raise ConnectionError("Payment processor unavailable.")
+        self.settled[key] = (method, amount_cents)
+        if len(self.settled) > self.remembered_keys:
+            self.settled.popitem(last=False)
+
+default_processor = FakeProcessor()
+
 class Payment:
-    def __init__(self):
-        pass
+    timeout = 5.0
+    retries = 3
+    backoff = 0.05
 
-    def pay(self, amount: float):
+    def __init__(self, processor: PaymentProcessor = None):
+        self.processor = processor if processor is not None else default_processor
+        self.key = uuid.uuid4().hex
+
+    async def pay(self, amount: float) -> PaymentResult:
         raise NotImplementedError("pay() should be implemented in subclasses.")
+
+    async def charge(self, method: str, amount_cents: int):
+        for attempt in range(self.retries + 1):
+            try:
+                await asyncio.wait_for(self.processor.charge(self.key, method, amount_cents), self.timeout)
+                return
+            except (asyncio.TimeoutError, ConnectionError):
+                if attempt == self.retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+
+    async def settle(self, method: str, amount: float, change: float, message: str) -> PaymentResult:
+        try:
+            await self.charge(method, to_cents(amount))
+        except (asyncio.TimeoutError, ConnectionError) as error:
+            metrics.count("payments_failed_total")
+            return PaymentResult("failed", amount, 0.0, f"Payment of {amount:.2f} failed: {str(error) or 'timed out'}")
+        metrics.count("payments_paid_total")
+        return PaymentResult("paid", amount, change, message)
     
 class CardPayment(Payment):
-    def __init__(self, card_number: str, cvv: str):
-        super().__init__()
+    def __init__(self, card_number: str, cvv: str, processor: PaymentProcessor = None):
+        super().__init__(processor)
         self.__card_number = card_number
         self.__cvv = cvv
 
@@ -206,44 +882,676 @@ class CardPayment(Payment):
     def get_cvv(self) -> str:
         return self.__cvv
 
-    def pay(self, amount: float):
-        print(f"Paid {amount:.2f} using card ************{self.__card_number[-4:]}")
+    @metrics.timed("payment_seconds")
+    async def pay(self, amount: float) -> PaymentResult:
+        return await self.settle("card", amount, 0.0,
+                                 f"Paid {amount:.2f} using card ************{self.__card_number[-4:]}")
 
 class CashPayment(Payment):
-    def __init__(self, amount_given: float):
-        super().__init__()
+    def __init__(self, amount_given: float, processor: PaymentProcessor = None):
+        super().__init__(processor)
         self.amount_given = amount_given
 
-    def pay(self, amount: float):
-        if self.amount_given >= amount:
-            print(f"Paid {amount:.2f} in cash. Change: {(self.amount_given - amount):.2f}")
+    @metrics.timed("payment_seconds")
+    async def pay(self, amount: float) -> PaymentResult:
+        given_cents, due_cents = to_cents(self.amount_given), to_cents(amount)
+        if given_cents >= due_cents:
+            change = from_cents(given_cents - due_cents)
+            return await self.settle("cash", amount, change,
+                                     f"Paid {amount:.2f} in cash. Change: {change:.2f}")
+        metrics.count("payments_declined_total")
+        return PaymentResult("declined", amount, 0.0,
+                             f"Not enough cash provided. Amount due: {from_cents(due_cents - given_cents):.2f}")
+
+async def settle_all(charges, concurrency: int = 500) -> list[PaymentResult]:
+    limit = asyncio.Semaphore(concurrency)
+    async def settle_one(payment, amount):
+        async with limit:
+            return await payment.pay(amount)
+    return await asyncio.gather(*(settle_one(payment, amount) for payment, amount in charges))
+
+def order_to_dict(order):
+    return {"items": [item.to_dict() for item in order.items]}
+
+def order_from_dict(order_data):
+    return Order([item for item in map(item_from_dict, order_data["items"]) if item is not None])
+
+ServedOrder = namedtuple("ServedOrder", ["order", "bill", "wait", "payment"])
+
+#Order journal: every placed order is appended to a JSON lines file before it enters
+#the queue, and marked served once its payment settles; the payment's idempotency key
+#names the order. A writer thread fsyncs whatever was appended since its last sync in
+#one go (group commit), so concurrent placements share a sync. Every checkpoint_every
+#records the file is rewritten with only the unserved orders, which bounds recovery to
+#the pending orders plus one checkpoint interval. Card numbers are kept to their last
+#four digits; the CVV is never written.
+class OrderJournal:
+    def __init__(self, filename="orders.journal", checkpoint_every: int = 10_000):
+        self.filename = filename
+        self.checkpoint_every = checkpoint_every
+        self.condition = threading.Condition()
+        self.buffer = []
+        self.appended = 0
+        self.synced = 0
+        self.closed = False
+        self.pending = self.read()
+        self.recovered = [(order_from_dict(record["order"]), payment_from_dict(record["payment"]))
+                          for record in map(json.loads, self.pending.values())]
+        self.since_checkpoint = 0
+        self.file = None
+        self.checkpoint()
+        self.thread = threading.Thread(target=self.write_loop, daemon=True)
+        self.thread.start()
+
+    def read(self) -> OrderedDict:
+        pending = OrderedDict()
+        try:
+            with open(self.filename, "rb") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        break  # a torn write at the end, nothing after it was synced
+                    if record["op"] == "placed":
+                        pending[record["key"]] = line
+                    else:
+                        pending.pop(record["key"], None)
+        except FileNotFoundError:
+            pass
+        return pending
+
+    def append(self, op: str, key: str, line: bytes) -> int:
+        with self.condition:
+            if self.closed:
+                return self.appended
+            self.buffer.append((op, key, line))
+            self.appended += 1
+            self.condition.notify_all()
+            return self.appended
+
+    def place(self, order: Order, payment) -> int:
+        record = {"op": "placed", "key": payment.key, "order": order_to_dict(order),
+                  "payment": payment_to_dict(payment)}
+        return self.append("placed", payment.key, json.dumps(record).encode("utf-8") + b"\n")
+
+    def serve(self, payment) -> int:
+        record = {"op": "served", "key": payment.key}
+        return self.append("served", payment.key, json.dumps(record).encode("utf-8") + b"\n")
+
+    def wait(self, sequence: int):
+        with self.condition:
+            while self.synced < sequence and not self.closed:
+                self.condition.wait()
+
+    def write_loop(self):
+        while True:
+            with self.condition:
+                while not self.buffer and not self.closed:
+                    self.condition.wait()
+                if not self.buffer:
+                    return
+                batch, self.buffer = self.buffer, []
+                sequence = self.appended
+            start = time.perf_counter()
+            self.file.write(b"".join(line for _, _, line in batch))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            metrics.observe("journal_sync_seconds", time.perf_counter() - start)
+            metrics.count("journal_records_total", len(batch))
+            for op, key, line in batch:
+                if op == "placed":
+                    self.pending[key] = line
+                else:
+                    self.pending.pop(key, None)
+            self.since_checkpoint += len(batch)
+            if self.since_checkpoint >= self.checkpoint_every:
+                self.checkpoint()
+            with self.condition:
+                self.synced = sequence
+                self.condition.notify_all()
+
+    def checkpoint(self):
+        if self.file is not None:
+            self.file.close()
+        temp_filename = self.filename + ".tmp"
+        with open(temp_filename, "wb") as f:
+            f.writelines(self.pending.values())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_filename, self.filename)
+        if os.name == "posix":
+            # the rename is only durable once the directory entry is synced
+            directory = os.open(os.path.dirname(os.path.abspath(self.filename)), os.O_RDONLY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        self.file = open(self.filename, "ab")
+        self.since_checkpoint = 0
+        metrics.count("journal_checkpoints_total")
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        self.thread.join()
+        self.checkpoint()
+        self.file.close()
+
+#Analytics: paid orders are folded into a rolling window split into slots; each slot
+#holds its own sums and the window keeps running totals, so recording an order and
+#reading the window both cost the same however long the stream runs. A slot's sums
+#are taken off the totals when the window moves past it. Top sellers are counted with
+#a Space-Saving sketch per period (a day by default): at most capacity items are
+#tracked, and an item's count is overestimated by at most its error.
+ANALYTICS_FIELDS = (("orders", "items", "gross_cents", "revenue_cents")
+                    + tuple(f"items_{category.__name__}" for category in CATEGORIES)
+                    + tuple(f"revenue_cents_{category.__name__}" for category in CATEGORIES)
+                    + ("discount_cents_order",)
+                    + tuple(f"discount_cents_{category.__name__}" for category in CATEGORIES))
+
+class RollingWindow:
+    def __init__(self, window: float = 3600.0, slots: int = 60, fields: int = len(ANALYTICS_FIELDS)):
+        self.window = window
+        self.width = window / slots
+        self.slots = [[0] * fields for _ in range(slots)]
+        self.totals = [0] * fields
+        self.current = None
+
+    def advance(self, now: float):
+        current = int(now // self.width)
+        if self.current is None or current - self.current >= len(self.slots):
+            for slot in self.slots:
+                slot[:] = [0] * len(slot)
+            self.totals = [0] * len(self.totals)
+        elif current > self.current:
+            for index in range(self.current + 1, current + 1):
+                slot = self.slots[index % len(self.slots)]
+                self.totals = [total - value for total, value in zip(self.totals, slot)]
+                slot[:] = [0] * len(slot)
+        if self.current is None or current > self.current:
+            self.current = current
+
+    def add(self, values, now: float):
+        self.advance(now)
+        slot = self.slots[self.current % len(self.slots)]
+        for i, value in enumerate(values):
+            slot[i] += value
+            self.totals[i] += value
+
+class SpaceSaving:
+    def __init__(self, capacity: int = 100):
+        self.capacity = capacity
+        self.counts = {}
+        self.errors = {}
+        # count -> keys with that count, oldest first, so the minimum is found in O(1)
+        self.buckets = defaultdict(dict)
+        self.minimum = 0
+
+    def add(self, key):
+        count = self.counts.get(key)
+        if count is None:
+            if len(self.counts) < self.capacity:
+                count = self.errors[key] = 0
+                self.minimum = 0
+            else:
+                # replace the least counted key; the newcomer may have been counted as it
+                bucket = self.buckets[self.minimum]
+                evicted = next(iter(bucket))
+                del bucket[evicted], self.counts[evicted], self.errors[evicted]
+                count = self.errors[key] = self.minimum
         else:
-            print(f"Not enough cash provided. Amount due: {(amount - self.amount_given):.2f}")
+            bucket = self.buckets[count]
+            del bucket[key]
+        if count in self.buckets and not self.buckets[count]:
+            del self.buckets[count]
+        self.counts[key] = count + 1
+        self.buckets[count + 1][key] = None
+        if count == self.minimum and count not in self.buckets:
+            self.minimum = count + 1
+
+    def top(self, n: int = 10) -> list[tuple]:
+        ranked = sorted(self.counts.items(), key=itemgetter(1), reverse=True)[:n]
+        return [(key, count, self.errors[key]) for key, count in ranked]
+
+class Analytics:
+    def __init__(self, window: float = 3600.0, slots: int = 60, top_capacity: int = 100,
+                 top_period: float = 86400.0):
+        self.lock = threading.Lock()
+        self.rolling = RollingWindow(window, slots)
+        self.top_capacity = top_capacity
+        self.top_period = top_period
+        self.period = None
+        self.sellers = SpaceSaving(top_capacity)
+
+    def record(self, order: Order, now: float = None):
+        now = time.time() if now is None else now
+        values = [1, len(order.items), order.total_cents, order.get_bill_cents()]
+        values.extend(order.counts[category] for category in CATEGORIES)
+        values.extend(order.subtotal_cents[category] for category in CATEGORIES)
+        values.extend(order.discount_cents())
+        with self.lock:
+            self.rolling.add(values, now)
+            period = int(now // self.top_period)
+            if period != self.period:
+                self.period, self.sellers = period, SpaceSaving(self.top_capacity)
+            for item in order.items:
+                self.sellers.add(item.name)
+
+    def top_sellers(self, n: int = 10) -> list[tuple]:
+        with self.lock:
+            return self.sellers.top(n)
+
+    def snapshot(self, now: float = None, top: int = 10) -> dict:
+        now = time.time() if now is None else now
+        with self.lock:
+            self.rolling.advance(now)
+            totals = dict(zip(ANALYTICS_FIELDS, self.rolling.totals))
+            sellers = self.sellers.top(top) if self.period == int(now // self.top_period) else []
+        names = [category.__name__ for category in CATEGORIES]
+        return {
+            "window_seconds": self.rolling.window,
+            "orders": totals["orders"],
+            "items": totals["items"],
+            "gross_cents": totals["gross_cents"],
+            "revenue_cents": totals["revenue_cents"],
+            "items_by_category": {name: totals[f"items_{name}"] for name in names},
+            "revenue_cents_by_category": {name: totals[f"revenue_cents_{name}"] for name in names},
+            "discount_cents": {name: totals[f"discount_cents_{name}"] for name in ("order",) + tuple(names)},
+            "top_sellers": [{"item": key, "count": count, "error": error} for key, count, error in sellers],
+        }
+
+#Order pipeline: placed orders wait in a bounded queue and worker threads bill them.
+#Payments are handed to an event loop thread, so many settlements are in flight at
+#once and a slow payment never blocks taking new orders. When the queue is full,
+#submit() blocks, rejects the order or spills it to disk, depending on policy.
+class OrderPipeline:
+    POLICIES = ("block", "reject", "spill")
+
+    def __init__(self, capacity: int = 3, workers: int = 2, policy: str = "reject",
+                 spill_filename: str = "orders.spill", journal: OrderJournal = None,
+                 analytics: Analytics = None):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown back-pressure policy '{policy}', use one of {self.POLICIES}.")
+        self.queue = Queue(maxsize=capacity)
+        self.policy = policy
+        self.journal = journal
+        self.analytics = analytics
+        self.spill_filename = spill_filename
+        # a spill file left by a crash has no payments to go with it; the journal has them
+        if os.path.exists(spill_filename):
+            os.remove(spill_filename)
+        # spilled orders live in the file, their payments and placement times stay here
+        self.spilled = deque()
+        self.spill_offset = 0
+        self.lock = threading.Lock()
+        self.served = deque(maxlen=1000)
+        self.waits = deque(maxlen=10000)
+        self.served_count = 0
+        self.closed = False
+        # settlements whose settled() callback hasn't finished; notified as each one does
+        self.settling = set()
+        self.all_settled = threading.Condition(self.lock)
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.loop_thread.start()
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+        self.recovered = 0
+        if journal is not None:
+            for order, payment in journal.recovered:
+                self.queue.put((order, payment, time.perf_counter()))
+                self.recovered += 1
+
+    def submit(self, order: Order, payment) -> bool:
+        if self.closed:
+            raise RuntimeError("The order pipeline has been shut down.")
+        job = (order, payment, time.perf_counter())
+        if self.policy == "block":
+            sequence = self.journaled(order, payment)
+            start = time.perf_counter()
+            self.queue.put(job)
+            put_seconds = time.perf_counter() - start
+        else:
+            with self.lock:
+                if not self.spilled and self.queue.full() and self.policy == "reject":
+                    metrics.count("orders_rejected_total")
+                    return False
+                # journaled before it is queued, so its served mark can never come first
+                sequence = self.journaled(order, payment)
+                start = time.perf_counter()
+                if not self.spilled and not self.queue.full():
+                    self.queue.put_nowait(job)
+                else:
+                    # once something is spilled, later orders spill too so they stay in order
+                    self.spill(job)
+                    metrics.count("orders_spilled_total")
+                put_seconds = time.perf_counter() - start
+        if self.journal is not None:
+            self.journal.wait(sequence)
+        self.placed(order, put_seconds)
+        return True
+
+    def journaled(self, order: Order, payment) -> int:
+        return self.journal.place(order, payment) if self.journal is not None else 0
+
+    def placed(self, order: Order, put_seconds: float):
+        # only the put (or spill) itself, the journal's fsync wait is journal_sync_seconds
+        if metrics.enabled:
+            metrics.observe("queue_put_seconds", put_seconds)
+            metrics.count("orders_total")
+            metrics.count("order_items_total", len(order.items))
+            metrics.set("queue_pending", self.pending())
+
+    def spill(self, job):
+        order, payment, placed = job
+        with open(self.spill_filename, "ab") as f:
+            f.write(json.dumps(order_to_dict(order)).encode("utf-8") + b"\n")
+        self.spilled.append((payment, placed))
+
+    def refill(self):
+        with self.lock:
+            if not self.spilled:
+                return
+            with open(self.spill_filename, "rb") as f:
+                f.seek(self.spill_offset)
+                while self.spilled and not self.queue.full():
+                    payment, placed = self.spilled.popleft()
+                    order = order_from_dict(json.loads(f.readline()))
+                    self.queue.put_nowait((order, payment, placed))
+                self.spill_offset = f.tell()
+            if not self.spilled:
+                os.remove(self.spill_filename)
+                self.spill_offset = 0
+
+    def work(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            order, payment, placed = job
+            wait = time.perf_counter() - placed
+            metrics.observe("queue_wait_seconds", wait)
+            try:
+                self.serve(order, payment, wait)
+            except Exception as error:
+                print(f"Could not serve order: {error}")
+                if self.journal is not None:
+                    self.journal.serve(payment)
+            finally:
+                self.queue.task_done()
+                self.refill()
+
+    def serve(self, order: Order, payment, wait: float):
+        bill = order.get_bill()
+        settlement = asyncio.run_coroutine_threadsafe(payment.pay(bill), self.loop)
+        with self.lock:
+            self.settling.add(settlement)
+        settlement.add_done_callback(lambda done: self.settled(done, order, payment, bill, wait))
+
+    def settled(self, settlement, order: Order, payment, bill: float, wait: float):
+        try:
+            result = settlement.result()
+        except Exception as error:
+            result = PaymentResult("failed", bill, 0.0, f"Payment of {bill:.2f} failed: {error}")
+        try:
+            if self.journal is not None:
+                self.journal.serve(payment)
+            if self.analytics is not None and result.status == "paid":
+                self.analytics.record(order)
+        finally:
+            with self.all_settled:
+                self.settling.discard(settlement)
+                self.served.append(ServedOrder(order, bill, wait, result))
+                self.waits.append(wait)
+                self.served_count += 1
+                self.all_settled.notify_all()
+
+    def full(self) -> bool:
+        return self.queue.full()
+
+    def pending(self) -> int:
+        return self.queue.qsize() + len(self.spilled)
+
+    def take_served(self) -> list[ServedOrder]:
+        with self.lock:
+            served = list(self.served)
+            self.served.clear()
+        return served
+
+    def stats(self) -> dict:
+        with self.lock:
+            waits = sorted(self.waits)
+            served = self.served_count
+        stats = {"served": served, "pending": self.pending(), "settling": len(self.settling),
+                 "workers": len(self.threads), "recovered": self.recovered}
+        if waits:
+            stats["mean_wait"] = sum(waits) / len(waits)
+            stats["p99_wait"] = waits[min(len(waits) - 1, int(len(waits) * 0.99))]
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        self.closed = True
+        if wait:
+            while True:
+                self.queue.join()
+                self.refill()
+                if self.queue.empty():
+                    break
+        for _ in self.threads:
+            self.queue.put(None)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+            # a future is done before its callbacks run, so wait for settled() itself:
+            # the journal must not close before every served mark is appended
+            with self.all_settled:
+                self.all_settled.wait_for(lambda: not self.settling)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        if self.journal is not None:
+            self.journal.close()
+
+#Kitchen: every order is split into one ticket per station, holding the order's items
+#of that category, and a ticket takes the sum of its items' prep times. Each station
+#keeps its waiting tickets in a heap. "spt" hands the shortest ticket to the next free
+#cook, which minimises the average ticket time over the station's cooks; "fifo" goes
+#by arrival. With aging, spt ranks tickets by placed + aging * prep_time instead, so a
+#ticket is never passed by one placed more than aging times its prep time after it and
+#long tickets are never starved.
+DEFAULT_COOKS = {Appetizer: 1, MainCourse: 2, Beverage: 1, Dessert: 1}
+
+class Ticket:
+    __slots__ = ("order_id", "category", "items", "prep_time", "placed", "sequence", "started")
+
+    def __init__(self, order_id, category, items: list[MenuItem], placed: float, sequence: int):
+        self.order_id = order_id
+        self.category = category
+        self.items = items
+        self.prep_time = sum(item.prep_time for item in items)
+        self.placed = placed
+        self.sequence = sequence
+        self.started = None
+
+class Station:
+    def __init__(self, category, cooks: int = 1, policy: str = "spt", aging: float = 5.0):
+        self.category = category
+        self.cooks = cooks
+        self.policy = policy
+        self.aging = aging
+        self.heap = []
+
+    def priority(self, ticket: Ticket) -> float:
+        if self.policy == "fifo":
+            return ticket.placed
+        if self.aging is None:
+            return ticket.prep_time
+        return ticket.placed + self.aging * ticket.prep_time
+
+    def push(self, ticket: Ticket):
+        heapq.heappush(self.heap, (self.priority(ticket), ticket.sequence, ticket))
+
+    def pop(self, now: float):
+        if not self.heap:
+            return None
+        ticket = heapq.heappop(self.heap)[2]
+        ticket.started = now
+        return ticket
+
+    def __len__(self):
+        return len(self.heap)
+
+class Kitchen:
+    POLICIES = ("spt", "fifo")
+
+    def __init__(self, cooks: dict = None, policy: str = "spt", aging: float = 5.0):
+        if policy not in self.POLICIES:
+            raise ValueError(f"Unknown kitchen policy '{policy}', use one of {self.POLICIES}.")
+        cooks = DEFAULT_COOKS if cooks is None else cooks
+        self.policy = policy
+        self.stations = {category: Station(category, cooks.get(category, 1), policy, aging)
+                         for category in CATEGORIES}
+        self.sequence = itertools.count()
+
+    def submit(self, order: Order, now: float, order_id=None) -> list[Ticket]:
+        by_category = defaultdict(list)
+        for item in order.items:
+            code = category_code(item)
+            if code >= 0:
+                by_category[CATEGORIES[code]].append(item)
+        tickets = []
+        for category in CATEGORIES:
+            if category in by_category:
+                ticket = Ticket(order_id, category, by_category[category], now, next(self.sequence))
+                self.stations[category].push(ticket)
+                tickets.append(ticket)
+        return tickets
+
+    def next_ticket(self, category, now: float):
+        return self.stations[category].pop(now)
+
+def percentiles(values) -> dict:
+    ordered = sorted(values)
+    if not ordered:
+        return {}
+    def pick(fraction):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+    return {"mean": sum(ordered) / len(ordered), "p50": pick(0.50), "p90": pick(0.90), "p99": pick(0.99),
+            "max": ordered[-1]}
+
+#Discrete event simulation of the kitchen: arrivals are (time, order) pairs in time
+#order, every station has its cooks, and simulated time jumps from one arrival or
+#finished ticket to the next, so hours of service replay in moments.
+def simulate_kitchen(arrivals, kitchen: Kitchen) -> dict:
+    free = {category: station.cooks for category, station in kitchen.stations.items()}
+    busy_time = dict.fromkeys(CATEGORIES, 0.0)
+    cooking = []
+    remaining = {}
+    ticket_waits, ticket_times, order_times = array("d"), array("d"), array("d")
+    first = now = None
+
+    def dispatch(category, now):
+        while free[category]:
+            ticket = kitchen.next_ticket(category, now)
+            if ticket is None:
+                return
+            free[category] -= 1
+            busy_time[category] += ticket.prep_time
+            ticket_waits.append(now - ticket.placed)
+            heapq.heappush(cooking, (now + ticket.prep_time, ticket.sequence, ticket))
+
+    def advance(until):
+        nonlocal now
+        while cooking and cooking[0][0] <= until:
+            now, _, ticket = heapq.heappop(cooking)
+            free[ticket.category] += 1
+            ticket_times.append(now - ticket.placed)
+            left = remaining[ticket.order_id]
+            left[0] -= 1
+            if left[0] == 0:
+                order_times.append(now - left[1])
+                del remaining[ticket.order_id]
+            dispatch(ticket.category, now)
+
+    orders = 0
+    for order_id, (placed, order) in enumerate(arrivals):
+        advance(placed)
+        if first is None:
+            first = placed
+        now = placed
+        tickets = kitchen.submit(order, placed, order_id)
+        orders += 1
+        if not tickets:
+            order_times.append(0.0)
+            continue
+        remaining[order_id] = [len(tickets), placed]
+        for ticket in tickets:
+            dispatch(ticket.category, placed)
+    advance(float("inf"))
+    elapsed = (now - first) if orders else 0.0
+    return {
+        "policy": kitchen.policy,
+        "orders": orders,
+        "tickets": len(ticket_times),
+        "simulated_seconds": elapsed,
+        "orders_per_hour": orders / elapsed * 3600 if elapsed > 0 else 0.0,
+        "ticket_wait": percentiles(ticket_waits),
+        "ticket_time": percentiles(ticket_times),
+        "order_time": percentiles(order_times),
+        "utilization": {category.__name__: busy_time[category] / (station.cooks * elapsed) if elapsed > 0 else 0.0
+                        for category, station in kitchen.stations.items()},
+    }
 
 #RETO7\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\
 
+def enable_ansi() -> bool:
+    # Windows consoles only act on escape codes once VT processing is turned on
+    if os.name != "nt":
+        return True
+    try:
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.GetStdHandle(-11)  # STD_OUTPUT_HANDLE
+        mode = ctypes.c_uint32()
+        if not kernel32.GetConsoleMode(handle, ctypes.byref(mode)):
+            return False
+        return bool(kernel32.SetConsoleMode(handle, mode.value | 0x0004))  # ENABLE_VIRTUAL_TERMINAL_PROCESSING
+    except (ImportError, AttributeError, OSError):
+        return False
+
+ansi_console = None
+
 def clear_console():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    # ANSI clear screen and cursor home, no subprocess per screen; consoles without VT
+    # support (older Windows) fall back to cls
+    global ansi_console
+    if ansi_console is None:
+        ansi_console = enable_ansi()
+    if ansi_console:
+        print("\033[2J\033[H", end="", flush=True)
+    else:
+        os.system("cls")
 
 def default_menu():
     menu = {}
-    menu["Empanadas"] = Appetizer("Empanadas", 3.50)
-    menu["Cheese Sticks"] = Appetizer("Cheese Sticks", 4.00)
-    menu["Mini Burgers"] = Appetizer("Mini Burgers", 5.00)
-    menu["Mini Waffles"] = Appetizer("Mini Waffles", 2.50)
-    menu["Salchipapa"] = Appetizer("Salchipapa", 5.00)
-    menu["Baby Beef"] = MainCourse("Baby Beef", 10.00, "Beef", "Rice", "Salad")
-    menu["Cordon Blue"] = MainCourse("Cordon Blue", 12.00, "Chicken", "Potatoes", "Salad")
-    menu["Salmon"] = MainCourse("Salmon", 15.00, "Fish", "Quinoa", "Lettuce")
-    menu["Burger"] = MainCourse("Burger", 8.00, "Beef", "Bread", "Onion")
-    menu["Coca Cola"] = Beverage("Coca Cola", 2.00, "Medium", "Soda")
-    menu["Orange Juice"] = Beverage("Orange Juice", 3.00, "Large", "Juice")
-    menu["Quatro"] = Beverage("Quatro", 2.50, "Small", "Soda")
-    menu["Chocolate Milkshake"] = Beverage("Chocolate Milkshake", 4.00, "Large", "Milkshake")
-    menu["Chocolate Cake"] = Dessert("Chocolate Cake", 5.00)
-    menu["Nutella Waffles"] = Dessert("Nutella Waffles", 6.00)
-    menu["Flan"] = Dessert("Flan", 4.00)
-    menu["Lemon Cheesecake"] = Dessert("Lemon Cheesecake", 5.00)
+    menu["Empanadas"] = Appetizer("Empanadas", 3.50, prep_time=180)
+    menu["Cheese Sticks"] = Appetizer("Cheese Sticks", 4.00, prep_time=240)
+    menu["Mini Burgers"] = Appetizer("Mini Burgers", 5.00, prep_time=360)
+    menu["Mini Waffles"] = Appetizer("Mini Waffles", 2.50, prep_time=240)
+    menu["Salchipapa"] = Appetizer("Salchipapa", 5.00, prep_time=300)
+    menu["Baby Beef"] = MainCourse("Baby Beef", 10.00, "Beef", "Rice", "Salad", prep_time=720)
+    menu["Cordon Blue"] = MainCourse("Cordon Blue", 12.00, "Chicken", "Potatoes", "Salad", prep_time=900)
+    menu["Salmon"] = MainCourse("Salmon", 15.00, "Fish", "Quinoa", "Lettuce", prep_time=840)
+    menu["Burger"] = MainCourse("Burger", 8.00, "Beef", "Bread", "Onion", prep_time=480)
+    menu["Coca Cola"] = Beverage("Coca Cola", 2.00, "Medium", "Soda", prep_time=15)
+    menu["Orange Juice"] = Beverage("Orange Juice", 3.00, "Large", "Juice", prep_time=90)
+    menu["Quatro"] = Beverage("Quatro", 2.50, "Small", "Soda", prep_time=15)
+    menu["Chocolate Milkshake"] = Beverage("Chocolate Milkshake", 4.00, "Large", "Milkshake", prep_time=150)
+    menu["Chocolate Cake"] = Dessert("Chocolate Cake", 5.00, prep_time=60)
+    menu["Nutella Waffles"] = Dessert("Nutella Waffles", 6.00, prep_time=300)
+    menu["Flan"] = Dessert("Flan", 4.00, prep_time=45)
+    menu["Lemon Cheesecake"] = Dessert("Lemon Cheesecake", 5.00, prep_time=60)
     return menu
 
 default = Menu(name="Default Menu", items=default_menu())
@@ -292,97 +1600,113 @@ def create_and_store_menu():
     menu = Menu(name=menuname, items=items)
     return menu
 
-def modify_menu(menus):
+def modify_menu(menus, log=None):
     clear_console()
     print("Menus available:")
-    for menu in menus:
-        print(f"- {menu.name}")
+    for name in menu_names(menus):
+        print(f"- {name}")
     modify = input("Do you want to modify a menu? (y/n):\n")
     if modify.lower() == "y":
         while True:
             menu_name = input("Enter the name of the menu to modify (or type 'exit' to go back):\n")
             if menu_name.lower() == "exit":
                 return
-            for menu in menus:
-                if menu.name == menu_name:
-                    while True:
-                        clear_console()
-                        print(f"Modifying menu: {menu.name}")
-                        print("Items:\n")
-                        for i, (item_name, item_obj) in enumerate(menu.items.items(), 1):
-                            print(f" {i}) {item_name}: {item_obj}\n")
-                        print("What do you want to do with this menu?")
-                        select = input("1) Add item"
-                                       "\n2) Remove item"
-                                       "\n3) Modify item"
-                                       "\n4) Exit menu modification\n")
-                        match select:
-                            case "1":
-                                item_name = input("Enter the name of the new item:\n")
-                                price = float(input("Enter the price of the new item:\n"))
-                                item_type = input("Enter the type of the new item:\n"
-                                                  "1) Appetizer\n"
-                                                  "2) Main Course\n"
-                                                  "3) Beverage\n"
-                                                  "4) Dessert\n")
-                                if item_type == "1":
-                                    menu.items[item_name] = Appetizer(item_name, price)
-                                elif item_type == "2":
-                                    protein = input("Enter the protein for this main course:\n")
-                                    grains = input("Enter the grains for this main course:\n")
-                                    vegetables = input("Enter the vegetables for this main course:\n")
-                                    menu.items[item_name] = MainCourse(item_name, price, protein, grains, vegetables)
-                                elif item_type == "3":
-                                    size = input("Enter the size of the beverage:\n")
-                                    beverage_type = input("Enter the type of beverage:\n")
-                                    menu.items[item_name] = Beverage(item_name, price, size, beverage_type)
-                                elif item_type == "4":
-                                    menu.items[item_name] = Dessert(item_name, price)
-                                else:
-                                    print("Invalid item type.")
-                            case "2":
-                                remove_item = input("Enter the name of the item to remove:\n")
-                                if remove_item in menu.items:
-                                    del menu.items[remove_item]
-                                    print(f"Item '{remove_item}' removed.")
-                                else:
-                                    print(f"Item '{remove_item}' not found in menu '{menu.name}'.")
-                            case "3":
-                                modify_item = input("Enter the name of the item to modify:\n")
-                                if modify_item in menu.items:
-                                    new_name = input(f"Enter new name for {modify_item} (leave blank to keep current name):\n")
-                                    new_price = float(input(f"Enter new price for {modify_item}:\n"))
-                                    menu.items[modify_item].set_price(new_price)
-                                    if new_name and new_name != modify_item:
-                                        menu.items[modify_item].set_name(new_name)
-                                        menu.items[new_name] = menu.items.pop(modify_item)
-                                        print(f"Item '{modify_item}' updated to '{new_name}' with new price {new_price}.")
-                                    else:
-                                        print(f"Item '{modify_item}' updated with new price {new_price}.")
-                                else:
-                                    print(f"Item '{modify_item}' not found in menu '{menu.name}'.")
-                            case "4":
-                                print("Exiting menu modification.")
-                                break
-                            case _:
-                                print("Invalid selection. Please choose again.")
-                    break  # Exit the for-loop after modifying the menu
-            else:
+            menu = find_menu(menus, menu_name)
+            if menu is None:
                 print(f"Menu '{menu_name}' not found. Please try again.")
-
-def make_order(menus, order_queue):
+                continue
+            while True:
+                clear_console()
+                print(f"Modifying menu: {menu.name}")
+                print("Items:\n")
+                print(menu.items.listing("modify"))
+                print("What do you want to do with this menu?")
+                select = input("1) Add item"
+                               "\n2) Remove item"
+                               "\n3) Modify item"
+                               "\n4) Exit menu modification\n")
+                match select:
+                    case "1":
+                        item_name = input("Enter the name of the new item:\n")
+                        price = float(input("Enter the price of the new item:\n"))
+                        item_type = input("Enter the type of the new item:\n"
+                                          "1) Appetizer\n"
+                                          "2) Main Course\n"
+                                          "3) Beverage\n"
+                                          "4) Dessert\n")
+                        if item_type == "1":
+                            menu.items[item_name] = Appetizer(item_name, price)
+                        elif item_type == "2":
+                            protein = input("Enter the protein for this main course:\n")
+                            grains = input("Enter the grains for this main course:\n")
+                            vegetables = input("Enter the vegetables for this main course:\n")
+                            menu.items[item_name] = MainCourse(item_name, price, protein, grains, vegetables)
+                        elif item_type == "3":
+                            size = input("Enter the size of the beverage:\n")
+                            beverage_type = input("Enter the type of beverage:\n")
+                            menu.items[item_name] = Beverage(item_name, price, size, beverage_type)
+                        elif item_type == "4":
+                            menu.items[item_name] = Dessert(item_name, price)
+                        else:
+                            print("Invalid item type.")
+                        if log is not None and item_name in menu.items:
+                            log.add_item(menu.name, item_name, menu.items[item_name])
+                    case "2":
+                        remove_item = input("Enter the name of the item to remove:\n")
+                        if remove_item in menu.items:
+                            del menu.items[remove_item]
+                            if log is not None:
+                                log.remove_item(menu.name, remove_item)
+                            print(f"Item '{remove_item}' removed.")
+                        else:
+                            print(f"Item '{remove_item}' not found in menu '{menu.name}'.")
+                    case "3":
+                        modify_item = input("Enter the name of the item to modify:\n")
+                        if modify_item in menu.items:
+                            new_name = input(f"Enter new name for {modify_item} (leave blank to keep current name):\n")
+                            new_price = float(input(f"Enter new price for {modify_item}:\n"))
+                            item_obj = menu.items[modify_item].set_price(new_price)
+                            if log is not None:
+                                log.reprice_item(menu.name, modify_item, new_price)
+                            if new_name and new_name != modify_item:
+                                del menu.items[modify_item]
+                                menu.items[new_name] = item_obj.set_name(new_name)
+                                if log is not None:
+                                    log.rename_item(menu.name, modify_item, new_name)
+                                print(f"Item '{modify_item}' updated to '{new_name}' with new price {new_price}.")
+                            else:
+                                menu.items[modify_item] = item_obj
+                                print(f"Item '{modify_item}' updated with new price {new_price}.")
+                        else:
+                            print(f"Item '{modify_item}' not found in menu '{menu.name}'.")
+                    case "4":
+                        print("Exiting menu modification.")
+                        break
+                    case _:
+                        print("Invalid selection. Please choose again.")
+
+def read_payment():
+    payment_method = input("Payment method? (card/cash): ")
+    if payment_method == "card":
+        return CardPayment(input("Card number: "), input("CVV: "))
+    elif payment_method == "cash":
+        return CashPayment(float(input("Amount given: ")))
+    return None
+
+def make_order(menus, pipeline):
     clear_console()
     while True:
         print("\nOrder Menu:")
         print("1) Place a new order")
-        print("2) Serve next order in queue")
+        print("2) Show served orders")
         print("3) Check if order queue is full")
-        print("4) Back to main menu")
+        print("4) Sales report")
+        print("5) Back to main menu")
         choice = input("Choose an option: ")
 
         match choice:
             case "1":
-                if order_queue.full():
+                if pipeline.policy == "reject" and pipeline.full():
                     print("Order queue is full! Cannot place a new order right now.")
                     continue
                 if len(menus) == 0:
@@ -390,8 +1714,8 @@ def make_order(menus, order_queue):
                     continue
                 clear_console()
                 print("Available menus:")
-                for i, menu in enumerate(menus, 1):
-                    print(f"{i}) {menu.name}")
+                for i, name in enumerate(menu_names(menus), 1):
+                    print(f"{i}) {name}")
                 menu_choice = input("Enter the number of the menu you'd like to order from:\n")
                 try:
                     menu_i = int(menu_choice) - 1
@@ -402,8 +1726,7 @@ def make_order(menus, order_queue):
 
                 print(f"\nItems in '{selected_menu.name}':")
                 item_list = list(selected_menu.items.items())
-                for idx, (item_name, item_obj) in enumerate(item_list, 1):
-                    print(f"{idx}) {item_name} - {item_obj}")
+                print(selected_menu.items.listing("order"))
 
                 order_items = []
                 while True:
@@ -423,80 +1746,608 @@ def make_order(menus, order_queue):
                     continue
 
                 order = Order(order_items)
-                order_queue.put(order)
-                print("\nYour order has been placed and added to the queue!")
                 print(order)
+                try:
+                    payment = read_payment()
+                except ValueError:
+                    payment = None
+                if payment is None:
+                    print("Unknown payment method, the order was not placed.")
+                    continue
+                if pipeline.submit(order, payment):
+                    print("\nYour order has been placed and added to the queue!")
+                else:
+                    print("Order queue is full! Cannot place a new order right now.")
 
             case "2":
-                if order_queue.empty():
-                    print("No orders to serve.")
-                else:
-                    next_order = order_queue.get()
-                    print("\nServing order:")
-                    print(next_order)
-                    payment_method = input("Payment method? (card/cash): ")
-                    if payment_method == "card":
-                        card = CardPayment(input("Card number: "), input("CVV: "))
-                        card.pay(next_order.get_bill())
-                    elif payment_method == "cash":
-                        amount = float(input("Amount given: "))
-                        cash = CashPayment(amount)
-                        cash.pay(next_order.get_bill())
-                    else:
-                        print("Unknown payment method.")
+                served = pipeline.take_served()
+                if not served:
+                    print("No orders served since you last checked.")
+                for served_order in served:
+                    print("\nServed order:")
+                    print(served_order.order)
+                    print(served_order.payment.message)
+                    print(f"Waited {served_order.wait:.2f}s in queue.")
 
             case "3":
-                if order_queue.full():
+                if pipeline.full():
                     print("The order queue is FULL (Serve them!!!).")
                 else:
                     print("The order queue is NOT FULL (Order some more!!!).")
 
             case "4":
+                if pipeline.analytics is None:
+                    print("Sales analytics are not enabled.")
+                else:
+                    print_sales_report(pipeline.analytics.snapshot())
+
+            case "5":
                 print("Returning to main menu.")
                 break
 
             case _:
                 print("Invalid selection. Please choose again.")
 
-def load_menus(filename="menus.json"):
+def print_sales_report(report: dict):
+    minutes = report["window_seconds"] / 60
+    print(f"\nLast {minutes:g} minutes: {report['orders']} orders, {report['items']} items, "
+          f"revenue {from_cents(report['revenue_cents']):.2f}")
+    for name, count in report["items_by_category"].items():
+        print(f"  {name}: {count} items, {from_cents(report['revenue_cents_by_category'][name]):.2f}")
+    discounts = ", ".join(f"{name} {from_cents(cents):.2f}" for name, cents in report["discount_cents"].items() if cents)
+    print(f"Discounts: {discounts or 'none'}")
+    print("Top sellers today:")
+    if not report["top_sellers"]:
+        print("  Nothing sold yet.")
+    for number, seller in enumerate(report["top_sellers"], 1):
+        error = f" (at most {seller['error']} too many)" if seller["error"] else ""
+        print(f"  {number}) {seller['item']}: {seller['count']}{error}")
+
+def item_from_dict(item_dict):
+    item_type = item_dict["type"]
+    prep_time = item_dict.get("prep_time")
+    if item_type == "Appetizer":
+        item = Appetizer(item_dict["name"], item_dict["price"], prep_time)
+    elif item_type == "MainCourse":
+        item = MainCourse(item_dict["name"], item_dict["price"],
+                          item_dict["protein"], item_dict["grains"], item_dict["vegetables"], prep_time)
+    elif item_type == "Beverage":
+        item = Beverage(item_dict["name"], item_dict["price"],
+                        item_dict["size"], item_dict["beverage_type"], prep_time)
+    elif item_type == "Dessert":
+        item = Dessert(item_dict["name"], item_dict["price"], prep_time)
+    else:
+        return None
+    if item_dict.get("is_vegan"):
+        item = item.set_is_vegan(True)
+    return item
+
+def menu_from_dict(menu_data):
+    items = {}
+    for name, item_dict in menu_data["items"].items():
+        item = item_from_dict(item_dict)
+        if item is not None:
+            items[name] = item
+    return Menu(name=menu_data["name"], items=items)
+
+#Lazy loading: the file is memory mapped and only scanned for the top level menu
+#objects (their name and byte range); items are built when a menu is first used.
+JSON_STRING = rb'"[^"\\]*(?:\\.[^"\\]*)*"'
+JSON_BRACKET = re.compile(rb'[^"\[\]{}]*(?:' + JSON_STRING + rb'[^"\[\]{}]*)*([\[\]{}])')
+JSON_NAME = re.compile(rb'"name"\s*:\s*(' + JSON_STRING + rb')')
+
+def scan_menus(data):
+    depth = 0
+    start = name = None
+    position = 0
+    for token in JSON_BRACKET.finditer(data):
+        bracket = token.start(1)
+        if depth == 2 and name is None:
+            # only the text directly inside the menu object can hold its name
+            found = JSON_NAME.search(data, position, bracket)
+            if found:
+                name = json.loads(found.group(1))
+        position = token.end()
+        if data[bracket] in b"[{":
+            depth += 1
+            if depth == 2:
+                start, name = bracket, None
+        else:
+            if depth == 2:
+                yield name, start, position
+            depth -= 1
+
+def iter_menus(filename="menus.json"):
+    if is_catalog_file(filename):
+        yield from load_menus(filename)
+        return
+    with open(filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for name, start, end in scan_menus(data):
+            yield menu_from_dict(json.loads(data[start:end]))
+
+class LazyMenus(MutableSequence):
+    def __init__(self, filename: str):
+        self.filename = filename
+        # entries are (name, start, end) until the menu is loaded, then the Menu itself
+        self.entries = self.read_index()
+        self.reindex()
+
+    def read_index(self):
+        # the scan is cached next to the file and reused while the file is unchanged
+        index_file = self.filename + ".idx"
+        stat = os.stat(self.filename)
+        signature = [stat.st_size, stat.st_mtime_ns]
+        try:
+            with open(index_file, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+            if cached["signature"] == signature:
+                return [tuple(entry) for entry in cached["menus"]]
+        except (OSError, ValueError, KeyError):
+            pass
+        with open(self.filename, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            entries = list(scan_menus(data))
+        try:
+            with open(index_file, "w", encoding="utf-8") as f:
+                json.dump({"signature": signature, "menus": entries}, f)
+        except OSError:
+            pass
+        return entries
+
+    def names(self) -> list[str]:
+        return [entry.name if isinstance(entry, Menu) else entry[0] for entry in self.entries]
+
+    def reindex(self):
+        # first position of every name, so lookups by name don't scan the entries
+        self.positions = {}
+        for i, name in enumerate(self.names()):
+            self.positions.setdefault(name, i)
+
+    def get(self, name: str, default=None):
+        i = self.positions.get(name)
+        return default if i is None else self[i]
+
+    def is_loaded(self, i: int) -> bool:
+        return isinstance(self.entries[i], Menu)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self.entries)))]
+        entry = self.entries[i]
+        if not isinstance(entry, Menu):
+            entry = self.entries[i] = self.load_entry(entry)
+        return entry
+
+    def load_entry(self, entry):
+        name, start, end = entry
+        with open(self.filename, "rb") as f:
+            f.seek(start)
+            return menu_from_dict(json.loads(f.read(end - start)))
+
+    def __setitem__(self, i, menu):
+        self.entries[i] = menu
+        self.reindex()
+
+    def __delitem__(self, i):
+        del self.entries[i]
+        self.reindex()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def insert(self, i, menu):
+        if i >= len(self.entries):
+            self.positions.setdefault(menu.name, len(self.entries))
+            self.entries.append(menu)
+        else:
+            self.entries.insert(i, menu)
+            self.reindex()
+
+#Catalog: menus by position and by name. Equal items (same type and fields) are
+#interned, so a menu copied across branches shares one object per item; the items
+#are immutable, so sharing them is safe. A catalog is saved in normalized form, every
+#distinct item once in "items" and each menu mapping its keys to item ids:
+#  {"items": [{...}, ...], "menus": [{"name": "Default Menu", "items": {"Burger": 8}}]}
+class Catalog(MutableSequence):
+    def __init__(self, menus=()):
+        self.menus = []
+        self.positions = {}
+        self.shared = {}
+        for menu in menus:
+            self.append(menu)
+
+    @staticmethod
+    def item_key(item: MenuItem) -> tuple:
+        return (type(item),) + tuple(getattr(item, field) for field in item._fields)
+
+    def intern(self, item: MenuItem) -> MenuItem:
+        return self.shared.setdefault(self.item_key(item), item)
+
+    def intern_items(self, menu):
+        for key, item in menu.items.items():
+            shared = self.intern(item)
+            if shared is not item:
+                # an equal item, so the menu's indexes and cached listings stay valid
+                dict.__setitem__(menu.items, key, shared)
+
+    def reindex(self):
+        self.positions = {}
+        for i, menu in enumerate(self.menus):
+            self.positions.setdefault(menu.name, i)
+
+    def names(self) -> list[str]:
+        return [menu.name for menu in self.menus]
+
+    def get(self, name: str, default=None):
+        i = self.positions.get(name)
+        return default if i is None else self.menus[i]
+
+    def __getitem__(self, i):
+        return self.menus[i]
+
+    def __setitem__(self, i, menu):
+        self.intern_items(menu)
+        self.menus[i] = menu
+        self.reindex()
+
+    def __delitem__(self, i):
+        del self.menus[i]
+        self.reindex()
+
+    def __len__(self):
+        return len(self.menus)
+
+    def insert(self, i, menu):
+        self.intern_items(menu)
+        if i >= len(self.menus):
+            self.positions.setdefault(menu.name, len(self.menus))
+            self.menus.append(menu)
+        else:
+            self.menus.insert(i, menu)
+            self.reindex()
+
+def catalog_to_dict(menus) -> dict:
+    ids, by_object, items = {}, {}, []
+    def item_id(item):
+        # shared objects are looked up by identity, the rest by value
+        found = by_object.get(id(item))
+        if found is None:
+            key = Catalog.item_key(item)
+            found = ids.get(key)
+            if found is None:
+                found = ids[key] = len(items)
+                items.append(item.to_dict())
+            by_object[id(item)] = found
+        return found
+    json_menus = [{"name": menu.name, "items": {key: item_id(item) for key, item in menu.items.items()}}
+                  for menu in menus]
+    return {"items": items, "menus": json_menus}
+
+def catalog_from_dict(data) -> Catalog:
+    items = [item_from_dict(item_dict) for item_dict in data["items"]]
+    catalog = Catalog()
+    for menu_data in data["menus"]:
+        # keys repeat across menus too, so they are interned like the items
+        menu_items = {sys.intern(key): items[item_id] for key, item_id in menu_data["items"].items()
+                      if items[item_id] is not None}
+        catalog.append(Menu(name=menu_data["name"], items=menu_items))
+    return catalog
+
+def is_catalog_file(filename: str) -> bool:
+    with open(filename, "rb") as f:
+        return f.read(64).lstrip().startswith(b"{")
+
+def menu_names(menus) -> list[str]:
+    if isinstance(menus, (LazyMenus, Catalog)):
+        return menus.names()
+    return [menu.name for menu in menus]
+
+#Catalog files are always loaded whole: their items are shared between menus, and the
+#shared table is what keeps them small.
+@metrics.timed("load_menus_seconds")
+def load_menus(filename="menus.json", lazy=False):
     try:
-        with open(filename, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        menus = []
-        for menu_data in data:
-            items = {}
-            for name, item_dict in menu_data["items"].items():
-                item_type = item_dict["type"]
-                if item_type == "Appetizer":
-                    items[name] = Appetizer(item_dict["name"], item_dict["price"])
-                elif item_type == "MainCourse":
-                    items[name] = MainCourse(item_dict["name"], item_dict["price"],
-                                            item_dict["protein"], item_dict["grains"], item_dict["vegetables"])
-                elif item_type == "Beverage":
-                    items[name] = Beverage(item_dict["name"], item_dict["price"],
-                                          item_dict["size"], item_dict["beverage_type"])
-                elif item_type == "Dessert":
-                    items[name] = Dessert(item_dict["name"], item_dict["price"])
-            menus.append(Menu(name=menu_data["name"], items=items))
-        return menus
+        if filename.endswith(".bin"):
+            menus = BinaryMenus(filename)
+        elif lazy and not is_catalog_file(filename):
+            menus = LazyMenus(filename)
+        else:
+            with open(filename, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                menus = catalog_from_dict(data)
+            else:
+                menus = [menu_from_dict(menu_data) for menu_data in data]
     except FileNotFoundError:
         print(f"No menu file found at {filename}, starting with default menu.")
-        return [default]
+        menus = [default]
+    return replay_menu_log(menus, filename)
     
+def menu_to_dict(menu):
+    return {
+        "name": menu.name,
+        "items": {name: item.to_dict() for name, item in menu.items.items()}
+    }
+
+@metrics.timed("export_menus_seconds")
 def export_menus(menus, filename="menus.json"):
-    json_menus = []
-    for menu in menus:
-        json_menu = {
-            "name": menu.name,
-            "items": {name: item.to_dict() for name, item in menu.items.items()}
-        }
-        json_menus.append(json_menu)
-    with open(filename, "w", encoding="utf-8") as f:
+    if isinstance(menus, Catalog):
+        json_menus = catalog_to_dict(menus)
+    else:
+        json_menus = [menu_to_dict(menu) for menu in menus]
+    # write next to the target and swap it in, so a crash never leaves half a snapshot
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "w", encoding="utf-8") as f:
         json.dump(json_menus, f, indent=4)
+    os.replace(temp_filename, filename)
     print(f"Menus exported to {filename}")
 
+def find_menu(menus, name):
+    if isinstance(menus, (LazyMenus, Catalog)):
+        return menus.get(name)
+    for i, menu_name in enumerate(menu_names(menus)):
+        if menu_name == name:
+            return menus[i]
+    return None
+
+#Menu changes are appended to <filename>.log as JSON lines and folded into the
+#snapshot every compact_every changes, so saving costs the size of the change.
+#The log starts with a "base" line naming the snapshot (size, mtime and inode) its
+#changes apply to. Compaction writes the new snapshot before resetting the log, so
+#after a crash in between the base no longer matches and the folded log is skipped;
+#replaying it would not be safe (a rename followed by an add under the old key would
+#overwrite the renamed item).
+def snapshot_signature(filename: str):
+    try:
+        stat = os.stat(filename)
+    except FileNotFoundError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns, stat.st_ino]
+
+def read_menu_log(filename="menus.json") -> list[dict]:
+    changes = []
+    try:
+        with open(filename + ".log", "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    change = json.loads(line)
+                except ValueError:
+                    break  # torn write at the end of the log
+                if change["op"] == "base":
+                    if change["snapshot"] != snapshot_signature(filename):
+                        return []  # already folded into the snapshot
+                    continue
+                changes.append(change)
+    except FileNotFoundError:
+        pass
+    return changes
+
+class MenuLog:
+    def __init__(self, menus, filename="menus.json", compact_every=100):
+        self.menus = menus
+        self.filename = filename
+        self.log_filename = filename + ".log"
+        self.compact_every = compact_every
+        # rewritten on open: drops a folded log or a torn last line, so new changes
+        # are never appended where replay would not reach them
+        changes = read_menu_log(filename)
+        self.reset(changes)
+        self.pending = len(changes)
+
+    def reset(self, changes=()):
+        temp_filename = self.log_filename + ".tmp"
+        with open(temp_filename, "w", encoding="utf-8") as f:
+            f.write(json.dumps({"op": "base", "snapshot": snapshot_signature(self.filename)}) + "\n")
+            f.writelines(json.dumps(change) + "\n" for change in changes)
+        os.replace(temp_filename, self.log_filename)
+
+    def record(self, op: str, **change):
+        change = {"op": op, **change}
+        with open(self.log_filename, "a", encoding="utf-8") as f:
+            f.write(json.dumps(change) + "\n")
+        self.pending += 1
+        if self.pending >= self.compact_every:
+            self.compact()
+
+    def add_menu(self, menu):
+        self.record("add_menu", menu=menu_to_dict(menu))
+
+    def add_item(self, menu_name: str, key: str, item: MenuItem):
+        self.record("add_item", menu=menu_name, key=key, item=item.to_dict())
+
+    def remove_item(self, menu_name: str, key: str):
+        self.record("remove_item", menu=menu_name, key=key)
+
+    def rename_item(self, menu_name: str, key: str, new_key: str):
+        self.record("rename_item", menu=menu_name, key=key, new_key=new_key)
+
+    def reprice_item(self, menu_name: str, key: str, price: float):
+        self.record("reprice_item", menu=menu_name, key=key, price=price)
+
+    def compact(self):
+        # the snapshot is rewritten in the format it was loaded from
+        if self.filename.endswith(".bin"):
+            export_menus_binary(self.menus, self.filename)
+        else:
+            export_menus(self.menus, self.filename)
+        self.reset()
+        self.pending = 0
+
+def apply_menu_change(menus, change):
+    op = change["op"]
+    if op == "add_menu":
+        menu = menu_from_dict(change["menu"])
+        existing = find_menu(menus, menu.name)
+        if existing is None:
+            menus.append(menu)
+        else:
+            existing.items.clear()
+            existing.items.update(menu.items)
+        return
+    menu = find_menu(menus, change["menu"])
+    if menu is None:
+        return
+    key = change["key"]
+    if op == "add_item":
+        item = item_from_dict(change["item"])
+        if item is not None:
+            menu.items[key] = menus.intern(item) if isinstance(menus, Catalog) else item
+    elif op == "remove_item":
+        menu.items.pop(key, None)
+    elif op == "rename_item":
+        if key in menu.items:
+            menu.items[change["new_key"]] = menu.items.pop(key).set_name(change["new_key"])
+    elif op == "reprice_item":
+        if key in menu.items:
+            menu.items[key] = menu.items[key].set_price(change["price"])
+
+def replay_menu_log(menus, filename="menus.json"):
+    for change in read_menu_log(filename):
+        apply_menu_change(menus, change)
+    return menus
+
+#Binary snapshot: a 32 byte header followed by fixed width columns and an interned
+#string table. Columns are read straight out of the memory map, so a menu's items are
+#only turned into objects when that menu is used. Byte order is little endian.
+#   prices    i64 x items             cents
+#   prep      f64 x items             prep time in seconds
+#   offsets   u32 x (strings + 1)     start of each string in the blob
+#   menus     u32 x menus x 3         name, first item, item count
+#   keys, names, attr1, attr2, attr3  u32 x items (string ids, NO_STRING when unused)
+#   types, vegan                      u8 x items
+#   blob      utf-8 bytes of every distinct string
+BINARY_MAGIC = b"RMNB"
+BINARY_VERSION = 3
+BINARY_HEADER = struct.Struct("<4sHHIIII8x")
+NO_STRING = 0xFFFFFFFF
+ITEM_ATTRIBUTES = {
+    MainCourse: ("protein", "grains", "vegetables"),
+    Beverage: ("size", "beverage_type"),
+}
+
+def export_menus_binary(menus, filename="menus.bin"):
+    if sys.byteorder != "little":
+        raise ValueError("The binary menu format is only supported on little endian machines.")
+    if isinstance(menus, BinaryMenus) and os.path.abspath(menus.filename) == os.path.abspath(filename):
+        menus.release()
+    strings = {}
+    def intern(text):
+        if text is None:
+            return NO_STRING
+        return strings.setdefault(text, len(strings))
+    menu_table = array("I")
+    prices = array("q")
+    prep_times = array("d")
+    keys, names = array("I"), array("I")
+    attributes = (array("I"), array("I"), array("I"))
+    types, vegan = array("B"), array("B")
+    for menu in menus:
+        menu_table.extend((intern(menu.name), len(prices), len(menu.items)))
+        for key, item in menu.items.items():
+            prices.append(item.price_cents)
+            prep_times.append(item.prep_time)
+            keys.append(intern(key))
+            names.append(intern(item.name))
+            fields = ITEM_ATTRIBUTES.get(type(item), ())
+            for column, field in zip(attributes, fields + (None,) * 3):
+                column.append(intern(getattr(item, field) if field else None))
+            types.append(category_code(item))
+            vegan.append(item.is_vegan)
+    encoded = [text.encode("utf-8") for text in strings]
+    offsets = array("I", [0])
+    for text in encoded:
+        offsets.append(offsets[-1] + len(text))
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "wb") as f:
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, len(strings),
+                                   len(menu_table) // 3, len(prices), offsets[-1]))
+        for column in (prices, prep_times, offsets, menu_table, keys, names, *attributes, types, vegan):
+            column.tofile(f)
+        f.write(b"".join(encoded))
+    os.replace(temp_filename, filename)
+
+class BinaryMenus(LazyMenus):
+    def read_index(self):
+        if sys.byteorder != "little":
+            raise ValueError("The binary menu format is only supported on little endian machines.")
+        with open(self.filename, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self.data)
+        magic, version, _, n_strings, n_menus, n_items, blob_size = BINARY_HEADER.unpack_from(view)
+        if magic != BINARY_MAGIC or version != BINARY_VERSION:
+            raise ValueError(f"{self.filename} is not a version {BINARY_VERSION} binary menu file.")
+        position = BINARY_HEADER.size
+        def column(fmt, length):
+            nonlocal position
+            size = length * array(fmt).itemsize
+            values = view[position:position + size].cast(fmt)
+            position += size
+            return values
+        self.prices = column("q", n_items)
+        self.prep_times = column("d", n_items)
+        self.offsets = column("I", n_strings + 1)
+        self.menu_table = column("I", n_menus * 3)
+        self.keys = column("I", n_items)
+        self.names_column = column("I", n_items)
+        self.attributes = (column("I", n_items), column("I", n_items), column("I", n_items))
+        self.types = column("B", n_items)
+        self.vegan = column("B", n_items)
+        self.blob = view[position:position + blob_size]
+        return [(self.string(self.menu_table[3 * m]), m) for m in range(n_menus)]
+
+    def string(self, i: int):
+        if i == NO_STRING:
+            return None
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+    def item(self, i: int) -> MenuItem:
+        category = CATEGORIES[self.types[i]]
+        attributes = [self.string(column[i]) for column in self.attributes[:len(ITEM_ATTRIBUTES.get(category, ()))]]
+        item = category(self.string(self.names_column[i]), from_cents(self.prices[i]), *attributes,
+                        prep_time=self.prep_times[i])
+        return item.set_is_vegan(True) if self.vegan[i] else item
+
+    def menu_prices(self, m: int) -> memoryview:
+        if self.data is None:
+            return memoryview(array("q", (item.price_cents for item in self[m].items.values())))
+        first, count = self.menu_table[3 * m + 1], self.menu_table[3 * m + 2]
+        return self.prices[first:first + count]
+
+    def release(self):
+        # loads every menu so nothing reads the map afterwards, then closes it: a mapped
+        # file can't be replaced on Windows, which compaction has to do
+        if self.data is None:
+            return
+        for i in range(len(self.entries)):
+            self[i]
+        for column in (self.prices, self.prep_times, self.offsets, self.menu_table, self.keys,
+                       self.names_column, *self.attributes, self.types, self.vegan, self.blob):
+            column.release()
+        self.data.close()
+        self.data = None
+
+    def load_entry(self, entry):
+        name, m = entry
+        first, count = self.menu_table[3 * m + 1], self.menu_table[3 * m + 2]
+        items = {self.string(self.keys[i]): self.item(i) for i in range(first, first + count)}
+        return Menu(name=name, items=items)
+
+def json_to_binary(json_filename="menus.json", binary_filename="menus.bin"):
+    export_menus_binary(iter_menus(json_filename), binary_filename)
+
+def binary_to_json(binary_filename="menus.bin", json_filename="menus.json"):
+    export_menus(BinaryMenus(binary_filename), json_filename)
+
+def json_to_catalog(json_filename="menus.json", catalog_filename="catalog.json"):
+    export_menus(Catalog(iter_menus(json_filename)), catalog_filename)
+
 def mainrestaurant():
-    menus = load_menus("menus.json")
+    menus = load_menus("menus.json", lazy=True)
+    Order.promotions = load_promotions("promotions.json")
+    log = MenuLog(menus, "menus.json")
+    pipeline = OrderPipeline(capacity=3, workers=2, journal=OrderJournal("orders.journal"),
+                             analytics=Analytics())
     while True:
             clear_console()
             selec = input("Welcome to food place!, please, write the number of the thing you'd like to do:\n\n"
@@ -510,22 +2361,565 @@ def mainrestaurant():
                     print("Create a new menu?, but it's my restaurant...\n")
                     menu = create_and_store_menu()
                     menus.append(menu)
+                    log.add_menu(menu)
                     print(f"Menu '{menu.name}' created with {len(menu.items)} items.")
                 case "2":
                     print("Look at menus and modify them? Sure, a costumer modifying menus...\n")
-                    modify_menu(menus)
+                    modify_menu(menus, log)
                 case "3":
-                    make_order(menus, order_queue=Queue(maxsize=3))
+                    make_order(menus, pipeline)
                 case "4":
                     print("Exporting menus to JSON files? That's espionage!\n")
-                    export_menus(menus, filename="menus.json")
+                    log.compact()
                 case "5":
                     clear_console()
+                    pipeline.shutdown()
                     print("Exiting the restaurant...\n"
                     "weird customer huh?")
                     break
                 case _:
                     print("Invalid selection. Please choose again.")
 
+#Headless mode: orders come in as JSON lines, one per order, for example
+#  {"id": 1, "menu": "Default Menu", "items": ["Burger", "Coca Cola"],
+#   "payment": {"method": "cash", "amount": 50}}
+#and one JSON line per order comes out with its bill and payment outcome. Only a
+#bounded window of orders is in flight, so memory stays constant for any stream.
+def payment_from_dict(payment_data):
+    method = payment_data.get("method")
+    if method == "card":
+        payment = CardPayment(str(payment_data["card_number"]), str(payment_data.get("cvv", "")))
+    elif method == "cash":
+        amount = float(payment_data["amount"])
+        if not math.isfinite(amount):
+            raise ValueError(f"Cash amount must be a finite number, not {payment_data['amount']!r}.")
+        payment = CashPayment(amount)
+    else:
+        raise ValueError(f"Unknown payment method {method!r}.")
+    if "key" in payment_data:
+        payment.key = str(payment_data["key"])
+    return payment
+
+def payment_to_dict(payment) -> dict:
+    if isinstance(payment, CardPayment):
+        # the processor charges by key, the receipt only shows the last four digits
+        return {"method": "card", "card_number": payment.get_card_number()[-4:], "key": payment.key}
+    elif isinstance(payment, CashPayment):
+        return {"method": "cash", "amount": payment.amount_given, "key": payment.key}
+    raise ValueError(f"Cannot record a {type(payment).__name__}.")
+
+class OrderResolver:
+    def __init__(self, menus):
+        self.menus = menus
+        self.menu_index = {name: i for i, name in enumerate(menu_names(menus))}
+
+    def resolve(self, order_data) -> Order:
+        menu_name = order_data["menu"]
+        if menu_name not in self.menu_index:
+            raise KeyError(f"Menu '{menu_name}' not found.")
+        items = self.menus[self.menu_index[menu_name]].items
+        missing = [name for name in order_data["items"] if name not in items]
+        if missing:
+            raise KeyError(f"Items not found in menu '{menu_name}': {', '.join(missing)}.")
+        if not order_data["items"]:
+            raise ValueError("No items selected for the order.")
+        return Order([items[name] for name in order_data["items"]])
+
+async def process_order_line(line: str, resolver: OrderResolver) -> dict:
+    result = {"id": None}
+    try:
+        order_data = json.loads(line)
+        result["id"] = order_data.get("id")
+        order = resolver.resolve(order_data)
+        payment = payment_from_dict(order_data.get("payment", {}))
+    except (ValueError, KeyError, TypeError, AttributeError) as error:
+        result.update(status="error", message=str(error.args[0]) if error.args else str(error))
+        metrics.count("orders_invalid_total")
+        return result
+    metrics.count("orders_total")
+    metrics.count("order_items_total", len(order.items))
+    bill = order.get_bill()
+    try:
+        paid = await payment.pay(bill)
+    except Exception as error:
+        # one bad payment fails its own line, not the whole run
+        result.update(status="error", message=str(error) or type(error).__name__)
+        return result
+    result.update(status=paid.status, items=len(order.items), discount1=order.discount1(),
+                  discount2=order.discount2(), bill=round(bill, 2), change=round(paid.change, 2),
+                  message=paid.message)
+    return result
+
+async def process_order_stream(lines, out, menus, window: int = 256) -> int:
+    resolver = OrderResolver(menus)
+    pending = deque()
+    processed = 0
+    for line in lines:
+        if not line.strip():
+            continue
+        pending.append(asyncio.ensure_future(process_order_line(line, resolver)))
+        if len(pending) >= window:
+            out.write(json.dumps(await pending.popleft()) + "\n")
+            processed += 1
+    while pending:
+        out.write(json.dumps(await pending.popleft()) + "\n")
+        processed += 1
+    return processed
+
+def run_headless(input_file="-", output_file="-", menus_file="menus.json",
+                 promotions_file="promotions.json", window: int = 256) -> int:
+    with contextlib.redirect_stdout(sys.stderr):
+        menus = load_menus(menus_file, lazy=True)
+    Order.promotions = load_promotions(promotions_file)
+    source = sys.stdin if input_file == "-" else open(input_file, "r", encoding="utf-8")
+    sink = sys.stdout if output_file == "-" else open(output_file, "w", encoding="utf-8")
+    try:
+        return asyncio.run(process_order_stream(source, sink, menus, window))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+
+#HTTP service: a small HTTP/1.1 server on asyncio streams with keep-alive. Menus are
+#loaded once and kept in memory; serialized menu responses are cached per menu and
+#rebuilt only when the menu's version changes.
+#   GET    /menus                         all menus
+#   GET    /menus/<menu>                  one menu
+#   GET    /menus/<menu>/items?...        Menu.query() filters as query parameters
+#   PUT    /menus/<menu>/items/<item>     add or replace an item (MenuItem.to_dict() body)
+#   DELETE /menus/<menu>/items/<item>     remove an item
+#   POST   /orders                        {"menu": ..., "items": [...]}, returns the bill
+#   GET    /orders/<id>                   bill of a placed order
+#   POST   /orders/<id>/pay               payment body as in headless mode
+#   GET    /analytics?top=10              rolling sales totals and top sellers of paid orders
+#   GET    /metrics                       Prometheus text (empty unless --metrics is on)
+HTTP_REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed", 409: "Conflict", 413: "Payload Too Large",
+                500: "Internal Server Error", 503: "Service Unavailable"}
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+ITEM_TEXT_FIELDS = ("name", "protein", "grains", "vegetables", "size", "beverage_type")
+
+class OrderService:
+    max_body = 1 << 20
+    max_unpaid_orders = 100_000
+
+    def __init__(self, menus, log: MenuLog = None, analytics: Analytics = None):
+        self.menus = menus
+        self.log = log
+        self.analytics = Analytics() if analytics is None else analytics
+        self.resolver = OrderResolver(menus)
+        self.orders = {}
+        self.order_ids = itertools.count(1)
+        self.menu_cache = {}
+        self.listing_cache = None
+        # orders with a payment in flight, so a second payment can't settle them twice
+        self.paying = set()
+
+    def menu(self, name: str):
+        if name not in self.resolver.menu_index:
+            raise HTTPError(404, f"Menu '{name}' not found.")
+        return self.menus[self.resolver.menu_index[name]]
+
+    def menu_body(self, menu) -> bytes:
+        cached = self.menu_cache.get(menu.name)
+        if cached is None or cached[0] is not menu.items or cached[1] != menu.items.version:
+            cached = (menu.items, menu.items.version, json.dumps(menu_to_dict(menu)).encode("utf-8"))
+            self.menu_cache[menu.name] = cached
+        return cached[2]
+
+    def listing_body(self) -> bytes:
+        names = menu_names(self.menus)
+        versions = tuple(self.menus[i].items.version for i in range(len(names)))
+        if self.listing_cache is None or self.listing_cache[0] != (names, versions):
+            body = b"[" + b",".join(self.menu_body(self.menus[i]) for i in range(len(names))) + b"]"
+            self.listing_cache = ((names, versions), body)
+        return self.listing_cache[1]
+
+    def bill_body(self, order_id: int, order: Order) -> dict:
+        return {"id": order_id, "items": len(order.items), "discount1": order.discount1(),
+                "discount2": order.discount2(), "bill": round(order.get_bill(), 2)}
+
+    async def handle(self, method: str, path: str, query: dict, body: bytes):
+        parts = [urllib.parse.unquote(part) for part in path.strip("/").split("/")]
+        if parts == ["metrics"] and method == "GET":
+            return 200, metrics.render()
+        if parts == ["analytics"] and method == "GET":
+            top = query.get("top", ["10"])[-1]
+            if not top.isdigit():
+                raise HTTPError(400, "top must be a whole number.")
+            return 200, self.analytics.snapshot(top=int(top))
+        if parts == ["menus"] and method == "GET":
+            return 200, self.listing_body()
+        if len(parts) == 2 and parts[0] == "menus" and method == "GET":
+            return 200, self.menu_body(self.menu(parts[1]))
+        if len(parts) == 3 and parts[0] == "menus" and parts[2] == "items" and method == "GET":
+            return 200, {key: item.to_dict() for key, item in self.menu(parts[1]).query(**self.filters(query)).items()}
+        if len(parts) == 4 and parts[0] == "menus" and parts[2] == "items":
+            menu, key = self.menu(parts[1]), parts[3]
+            if method == "PUT":
+                item = self.item_body(self.json_body(body))
+                menu.items[key] = item
+                if self.log is not None:
+                    self.log.add_item(menu.name, key, item)
+                return 200, item.to_dict()
+            if method == "DELETE":
+                if key not in menu.items:
+                    raise HTTPError(404, f"Item '{key}' not found in menu '{menu.name}'.")
+                del menu.items[key]
+                if self.log is not None:
+                    self.log.remove_item(menu.name, key)
+                return 200, {"removed": key}
+            raise HTTPError(405, "Use PUT or DELETE on menu items.")
+        if parts == ["orders"] and method == "POST":
+            if len(self.orders) >= self.max_unpaid_orders:
+                metrics.count("orders_rejected_total")
+                raise HTTPError(503, "Too many unpaid orders, try again later.")
+            try:
+                order = self.resolver.resolve(self.json_body(body))
+            except (KeyError, ValueError, TypeError) as error:
+                metrics.count("orders_invalid_total")
+                raise HTTPError(400, str(error.args[0]) if error.args else str(error))
+            metrics.count("orders_total")
+            metrics.count("order_items_total", len(order.items))
+            order_id = next(self.order_ids)
+            self.orders[order_id] = order
+            return 201, self.bill_body(order_id, order)
+        if len(parts) >= 2 and parts[0] == "orders":
+            order_id = int(parts[1]) if parts[1].isdigit() else None
+            if order_id not in self.orders:
+                raise HTTPError(404, f"Order '{parts[1]}' not found.")
+            order = self.orders[order_id]
+            if len(parts) == 2 and method == "GET":
+                return 200, self.bill_body(order_id, order)
+            if len(parts) == 3 and parts[2] == "pay" and method == "POST":
+                try:
+                    payment = payment_from_dict(self.json_body(body))
+                except (KeyError, ValueError, TypeError) as error:
+                    raise HTTPError(400, str(error.args[0]) if error.args else str(error))
+                if order_id in self.paying:
+                    raise HTTPError(409, f"Order '{order_id}' already has a payment in progress.")
+                self.paying.add(order_id)
+                try:
+                    result = await payment.pay(order.get_bill())
+                finally:
+                    self.paying.discard(order_id)
+                if result.status == "paid":
+                    del self.orders[order_id]
+                    self.analytics.record(order)
+                return 200, dict(self.bill_body(order_id, order), **result._asdict())
+        raise HTTPError(404, f"No route for {method} {path}.")
+
+    @staticmethod
+    def item_body(data: dict) -> MenuItem:
+        # everything is checked before the item reaches the menu: a bad field would be
+        # stored, logged, written by the next compaction and break the next load
+        for field in ITEM_TEXT_FIELDS:
+            if field in data and not isinstance(data[field], str):
+                raise HTTPError(400, f"The item's {field!r} field must be a string.")
+        try:
+            item = item_from_dict(data)
+        except KeyError as error:
+            raise HTTPError(400, f"The item is missing its {error.args[0]!r} field.")
+        except (ValueError, TypeError, ArithmeticError) as error:
+            raise HTTPError(400, f"Invalid item: {error}")
+        if item is None:
+            raise HTTPError(400, "Unknown item type.")
+        if not math.isfinite(item.prep_time) or item.prep_time < 0:
+            raise HTTPError(400, "The item's prep_time must be a finite, non-negative number.")
+        return item
+
+    @staticmethod
+    def json_body(body: bytes):
+        try:
+            data = json.loads(body or b"null")
+        except ValueError:
+            raise HTTPError(400, "The request body is not valid JSON.")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "The request body must be a JSON object.")
+        return data
+
+    @staticmethod
+    def filters(query: dict) -> dict:
+        filters = {}
+        for name, values in query.items():
+            value = values[-1]
+            if name == "category":
+                categories = {category.__name__: category for category in CATEGORIES}
+                if value not in categories:
+                    raise HTTPError(400, f"Unknown category '{value}'.")
+                filters[name] = categories[value]
+            elif name == "vegan":
+                filters[name] = value.lower() in ("1", "true", "yes")
+            elif name in ("min_price", "max_price"):
+                try:
+                    filters[name] = float(value)
+                except ValueError:
+                    raise HTTPError(400, f"{name} must be a number.")
+            elif name in ("ingredient", "size", "beverage_type"):
+                filters[name] = value
+            else:
+                raise HTTPError(400, f"Unknown filter '{name}'.")
+        return filters
+
+    async def connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b"\r\n\r\n")
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+                    return
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ")
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "Malformed request line."}, False)
+                    return
+                headers = {}
+                for header in header_lines:
+                    if ":" in header:
+                        name, value = header.split(":", 1)
+                        headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    length = int(headers.get("content-length", "0") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    await self.respond(writer, 400, {"error": "Invalid Content-Length."}, False)
+                    return
+                if length > self.max_body:
+                    await self.respond(writer, 413, {"error": "Request body too large."}, False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+                url = urllib.parse.urlsplit(target)
+                try:
+                    status, payload = await self.handle(method, url.path, urllib.parse.parse_qs(url.query), body)
+                except HTTPError as error:
+                    status, payload = error.status, {"error": str(error)}
+                except Exception as error:
+                    status, payload = 500, {"error": str(error)}
+                await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    return
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool):
+        content_type = "application/json"
+        if isinstance(payload, str):
+            body, content_type = payload.encode("utf-8"), "text/plain; version=0.0.4"
+        else:
+            body = payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+async def serve_http(service: OrderService, host: str = "127.0.0.1", port: int = 8080):
+    server = await asyncio.start_server(service.connection, host, port, backlog=4096)
+    print(f"Serving the food place on http://{host}:{port}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+def run_server(host="127.0.0.1", port=8080, menus_file="menus.json", promotions_file="promotions.json"):
+    with contextlib.redirect_stdout(sys.stderr):
+        menus = load_menus(menus_file, lazy=True)
+    Order.promotions = load_promotions(promotions_file)
+    service = OrderService(menus, MenuLog(menus, menus_file))
+    try:
+        asyncio.run(serve_http(service, host, port))
+    except KeyboardInterrupt:
+        pass
+
+#Sharded replay: orders (headless JSON lines) are split by id over worker processes;
+#lines without an id are split by line number instead. The menus are loaded in the
+#parent before the pool forks, so workers read them through copy-on-write memory
+#instead of receiving pickled items; on platforms without fork each worker loads them
+#once in its initializer. Every worker scans the orders file itself and only parses
+#the lines of its shard, and only the shard totals travel back to the parent.
+ORDER_ID = re.compile(r'"id"\s*:\s*("(?:[^"\\]|\\.)*"|[^,}\s]+)')
+replay_menus = None
+
+def shard_of(order_id: str, shards: int) -> int:
+    return zlib.crc32(order_id.encode("utf-8")) % shards
+
+def init_replay_worker(menus_file: str, promotions_file: str):
+    global replay_menus
+    with contextlib.redirect_stdout(sys.stderr):
+        replay_menus = load_menus(menus_file)
+    Order.promotions = load_promotions(promotions_file)
+
+def empty_totals() -> dict:
+    return {"orders": 0, "errors": 0, "items": 0, "gross_cents": 0, "net_cents": 0,
+            "counts": {category.__name__: 0 for category in CATEGORIES},
+            "revenue_cents": {category.__name__: 0 for category in CATEGORIES}}
+
+def merge_totals(totals: dict, other: dict) -> dict:
+    for key in ("orders", "errors", "items", "gross_cents", "net_cents"):
+        totals[key] += other[key]
+    for key in ("counts", "revenue_cents"):
+        for name, value in other[key].items():
+            totals[key][name] += value
+    return totals
+
+def replay_shard(orders_file: str, shard: int, shards: int) -> dict:
+    resolver = OrderResolver(replay_menus)
+    totals = empty_totals()
+    with open(orders_file, "r", encoding="utf-8") as f:
+        for number, line in enumerate(f):
+            if not line.strip():
+                continue
+            found = ORDER_ID.search(line)
+            owner = number % shards if found is None else shard_of(found.group(1), shards)
+            if owner != shard:
+                continue
+            try:
+                order = resolver.resolve(json.loads(line))
+            except (ValueError, KeyError, TypeError):
+                totals["errors"] += 1
+                continue
+            totals["orders"] += 1
+            totals["items"] += len(order.items)
+            totals["gross_cents"] += order.total_cents
+            totals["net_cents"] += order.get_bill_cents()
+            for category in CATEGORIES:
+                totals["counts"][category.__name__] += order.counts[category]
+                totals["revenue_cents"][category.__name__] += order.subtotal_cents[category]
+    return totals
+
+def replay_sharded(orders_file: str, menus_file="menus.json", promotions_file="promotions.json",
+                   processes: int = None) -> dict:
+    global replay_menus
+    processes = processes or os.cpu_count() or 1
+    start = time.perf_counter()
+    methods = multiprocessing.get_all_start_methods()
+    context = multiprocessing.get_context("fork" if "fork" in methods else "spawn")
+    forked = context.get_start_method() == "fork"
+    saved = (replay_menus, Order.promotions)
+    try:
+        if forked:
+            # workers inherit what the parent loads here, so they need no initializer
+            init_replay_worker(menus_file, promotions_file)
+            gc.freeze()  # keep the collector from touching (and copying) the shared menu pages
+        with context.Pool(processes, initializer=None if forked else init_replay_worker,
+                          initargs=() if forked else (menus_file, promotions_file)) as pool:
+            shard_totals = pool.starmap(replay_shard, [(orders_file, shard, processes)
+                                                       for shard in range(processes)])
+    finally:
+        if forked:
+            gc.unfreeze()
+        replay_menus, Order.promotions = saved
+    totals = empty_totals()
+    for shard in shard_totals:
+        merge_totals(totals, shard)
+    elapsed = time.perf_counter() - start
+    totals["processes"] = processes
+    totals["seconds"] = elapsed
+    totals["orders_per_second"] = totals["orders"] / elapsed if elapsed > 0 else float("inf")
+    return totals
+
+#Kitchen simulation: orders (headless JSON lines) arrive at their "at" time in seconds
+#when they have one, otherwise at random with an average of rate orders per minute.
+def parse_cooks(text: str) -> dict:
+    cooks = dict(DEFAULT_COOKS)
+    by_name = {category.__name__: category for category in CATEGORIES}
+    for part in filter(None, (text or "").split(",")):
+        name, count = part.split("=")
+        if name.strip() not in by_name:
+            raise ValueError(f"Unknown station '{name.strip()}'.")
+        cooks[by_name[name.strip()]] = int(count)
+    return cooks
+
+def run_simulation(orders_file: str, menus_file="menus.json", rate: float = 1.0, cooks: dict = None,
+                   policy: str = "spt", aging: float = 5.0, seed: int = 0) -> dict:
+    with contextlib.redirect_stdout(sys.stderr):
+        menus = load_menus(menus_file, lazy=True)
+    resolver = OrderResolver(menus)
+    rng = random.Random(seed)
+    errors = 0
+
+    def arrivals(lines):
+        nonlocal errors
+        clock = 0.0
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                order_data = json.loads(line)
+                order = resolver.resolve(order_data)
+                at = float(order_data["at"]) if "at" in order_data else None
+                if at is not None and not math.isfinite(at):
+                    raise ValueError(f"Invalid arrival time {order_data['at']!r}.")
+            except (ValueError, KeyError, TypeError):
+                errors += 1
+                continue
+            if at is not None:
+                clock = max(clock, at)
+            else:
+                clock += rng.expovariate(rate / 60)
+            yield clock, order
+
+    start = time.perf_counter()
+    with open(orders_file, "r", encoding="utf-8") as f:
+        report = simulate_kitchen(arrivals(f), Kitchen(cooks, policy, aging))
+    report["errors"] = errors
+    report["cooks"] = {category.__name__: count for category, count in (cooks or DEFAULT_COOKS).items()}
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Food place ordering system.")
+    parser.add_argument("--headless", action="store_true",
+                        help="read orders as JSON lines and write bills as JSON lines, no prompts")
+    parser.add_argument("--input", default="-", help="orders file for --headless ('-' for stdin)")
+    parser.add_argument("--output", default="-", help="results file for --headless ('-' for stdout)")
+    parser.add_argument("--serve", action="store_true", help="run the HTTP ordering service")
+    parser.add_argument("--host", default="127.0.0.1", help="address for --serve")
+    parser.add_argument("--port", type=int, default=8080, help="port for --serve")
+    parser.add_argument("--replay", metavar="ORDERS", help="bill an orders file (JSON lines) across processes")
+    parser.add_argument("--processes", type=int, default=None, help="worker processes for --replay")
+    parser.add_argument("--simulate", metavar="ORDERS", help="replay an orders file (JSON lines) through the kitchen")
+    parser.add_argument("--rate", type=float, default=1.0,
+                        help="orders per minute for --simulate when orders have no 'at' time")
+    parser.add_argument("--cooks", default="", help="cooks per station for --simulate, e.g. MainCourse=3,Dessert=1")
+    parser.add_argument("--policy", choices=Kitchen.POLICIES, default="spt", help="ticket order for --simulate")
+    parser.add_argument("--aging", type=float, default=5.0,
+                        help="spt starvation guard for --simulate, higher is closer to pure shortest first")
+    parser.add_argument("--menus", default="menus.json", help="menus file (.json or .bin)")
+    parser.add_argument("--promotions", default="promotions.json", help="promotions file")
+    parser.add_argument("--window", type=int, default=256, help="orders in flight in --headless mode")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="collect timings and counters and write them to FILE (Prometheus text) on exit")
+    args = parser.parse_args(argv)
+    metrics.enabled = args.metrics is not None
+    try:
+        if args.headless:
+            processed = run_headless(args.input, args.output, args.menus, args.promotions, args.window)
+            print(f"Processed {processed} orders.", file=sys.stderr)
+        elif args.replay:
+            print(json.dumps(replay_sharded(args.replay, args.menus, args.promotions, args.processes), indent=4))
+        elif args.simulate:
+            report = run_simulation(args.simulate, args.menus, args.rate, parse_cooks(args.cooks),
+                                    args.policy, args.aging)
+            print(json.dumps(report, indent=4))
+        elif args.serve:
+            run_server(args.host, args.port, args.menus, args.promotions)
+        else:
+            mainrestaurant()
+    finally:
+        if args.metrics:
+            metrics.export(args.metrics)
+
 if __name__ == "__main__":
-    mainrestaurant()
+    main()
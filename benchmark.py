@@ -0,0 +1,190 @@
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+def load_restaurant():
+    spec = importlib.util.spec_from_file_location("restaurant", os.path.join(HERE, "Restaurant final.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["restaurant"] = module
+    spec.loader.exec_module(module)
+    return module
+
+restaurant = load_restaurant()
+
+#Synthetic data: menus with n items spread over the four item types, and orders with
+#a given size and category mix (weights per type, e.g. "MainCourse=2,Beverage=1").
+def make_item(category, i: int, rng: random.Random):
+    name = f"{category.__name__} {i}"
+    price = rng.randint(100, 2500) / 100
+    if category is restaurant.MainCourse:
+        return category(name, price, rng.choice(["Beef", "Chicken", "Fish", "Tofu"]),
+                        rng.choice(["Rice", "Bread", "Quinoa"]), rng.choice(["Salad", "Onion", "Lettuce"]))
+    if category is restaurant.Beverage:
+        return category(name, price, rng.choice(["Small", "Medium", "Large"]),
+                        rng.choice(["Soda", "Juice", "Milkshake"]))
+    return category(name, price)
+
+def make_menus(n_menus: int, n_items: int, seed: int = 0):
+    rng = random.Random(seed)
+    menus = []
+    for m in range(n_menus):
+        items = {}
+        for i in range(n_items):
+            item = make_item(restaurant.CATEGORIES[i % len(restaurant.CATEGORIES)], i, rng)
+            items[item.name] = item
+        menus.append(restaurant.Menu(name=f"Menu {m}", items=items))
+    return menus
+
+def parse_mix(mix: str) -> dict:
+    weights = {category: 1.0 for category in restaurant.CATEGORIES}
+    if mix:
+        weights = {category: 0.0 for category in restaurant.CATEGORIES}
+        by_name = {category.__name__: category for category in restaurant.CATEGORIES}
+        for part in mix.split(","):
+            name, weight = part.split("=")
+            weights[by_name[name.strip()]] = float(weight)
+    return weights
+
+def make_orders(menu, n_orders: int, size: int, mix: dict, seed: int = 0):
+    rng = random.Random(seed)
+    by_category = {category: [item for item in menu.items.values() if isinstance(item, category)]
+                   for category in restaurant.CATEGORIES}
+    categories = [category for category in restaurant.CATEGORIES if by_category[category] and mix[category] > 0]
+    weights = [mix[category] for category in categories]
+    orders = []
+    for _ in range(n_orders):
+        picked = rng.choices(categories, weights, k=size)
+        orders.append(restaurant.Order([rng.choice(by_category[category]) for category in picked]))
+    return orders
+
+def measure(function, repeat: int, number: int = 1) -> dict:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        timings.append((time.perf_counter() - start) / number)
+    return {"min": min(timings), "median": statistics.median(timings), "repeat": repeat, "number": number}
+
+def run(args) -> dict:
+    mix = parse_mix(args.mix)
+    menus = make_menus(args.menus, args.items, args.seed)
+    orders = make_orders(menus[0], args.orders, args.order_size, mix, args.seed)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        json_file = os.path.join(tmp, "menus.json")
+        binary_file = os.path.join(tmp, "menus.bin")
+        restaurant.export_menus(menus, json_file)
+        restaurant.export_menus_binary(menus, binary_file)
+        results["export_menus"] = measure(lambda: restaurant.export_menus(menus, json_file), args.repeat)
+        results["export_menus_binary"] = measure(lambda: restaurant.export_menus_binary(menus, binary_file), args.repeat)
+        results["load_menus"] = measure(lambda: restaurant.load_menus(json_file), args.repeat)
+        def load_lazy():
+            if os.path.exists(json_file + ".idx"):
+                os.remove(json_file + ".idx")
+            return restaurant.load_menus(json_file, lazy=True)
+        results["load_menus_lazy"] = measure(load_lazy, args.repeat)
+        results["load_menus_binary"] = measure(lambda: restaurant.load_menus(binary_file), args.repeat)
+        catalog_file = os.path.join(tmp, "catalog.json")
+        catalog = restaurant.Catalog(menus)
+        restaurant.export_menus(catalog, catalog_file)
+        results["export_catalog"] = measure(lambda: restaurant.export_menus(catalog, catalog_file), args.repeat)
+        results["load_catalog"] = measure(lambda: restaurant.load_menus(catalog_file), args.repeat)
+    results["order_build"] = measure(lambda: [restaurant.Order(order.items) for order in orders], args.repeat)
+    # billing and receipts are cached per order (and receipts per item list too), so the
+    # caches are dropped inside the timed function to measure the work, not the hits
+    def get_bill():
+        for order in orders:
+            order.cached_percents = None
+        return [order.get_bill() for order in orders]
+    results["get_bill"] = measure(get_bill, args.repeat)
+    def receipt():
+        restaurant.receipt_cache.clear()
+        for order in orders:
+            order.cached_percents = order.receipt = None
+        return [str(order) for order in orders]
+    results["receipt"] = measure(receipt, args.repeat)
+    results["bill_orders"] = measure(lambda: restaurant.bill_orders(orders), args.repeat)
+    # the pipeline deletes a leftover spill file on start, so it must not use the one
+    # in the current directory, where a running console may keep its own
+    with tempfile.TemporaryDirectory() as tmp:
+        spill_file = os.path.join(tmp, "orders.spill")
+        def pipeline():
+            queue = restaurant.OrderPipeline(capacity=args.capacity, workers=args.workers, policy="block",
+                                             spill_filename=spill_file)
+            for order in orders:
+                queue.submit(order, restaurant.CashPayment(1_000_000))
+            queue.shutdown()
+        results["pipeline"] = measure(pipeline, args.repeat)
+    for name in ("order_build", "get_bill", "receipt", "bill_orders", "pipeline"):
+        results[name]["orders_per_second"] = args.orders / results[name]["min"]
+    return results
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["min"], result["min"]
+        if after > before * (1 + tolerance):
+            regressions.append(f"{name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms "
+                               f"(+{(after / before - 1) * 100:.1f}%)")
+    return regressions
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark menu loading, order billing and receipts.")
+    parser.add_argument("--menus", type=int, default=20, help="number of synthetic menus")
+    parser.add_argument("--items", type=int, default=200, help="items per synthetic menu")
+    parser.add_argument("--orders", type=int, default=2000, help="number of synthetic orders")
+    parser.add_argument("--order-size", type=int, default=20, help="items per order")
+    parser.add_argument("--mix", default="", help="category weights, e.g. MainCourse=2,Beverage=1")
+    parser.add_argument("--capacity", type=int, default=100, help="pipeline queue capacity")
+    parser.add_argument("--workers", type=int, default=2, help="pipeline worker threads")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="where to save the results")
+    parser.add_argument("--baseline", help="saved results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed slowdown before flagging")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    for name, result in results.items():
+        line = f"{name:<22} min {result['min'] * 1000:10.3f} ms   median {result['median'] * 1000:10.3f} ms"
+        if "orders_per_second" in result:
+            line += f"   {result['orders_per_second']:12.0f} orders/s"
+        print(line)
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "parameters": {key: value for key, value in vars(args).items() if key not in ("output", "baseline", "tolerance")},
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results saved to {args.output}")
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("parameters") != report["parameters"]:
+            print("Warning: the baseline was recorded with different parameters.")
+        regressions = compare(results, baseline["results"], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
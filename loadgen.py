@@ -0,0 +1,132 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import urllib.parse
+
+#Load generator for the HTTP service ("Restaurant final.py" --serve). Every client
+#keeps one keep-alive connection open and sends requests back to back.
+class Client:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def connect(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, payload=None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        head = (f"{method} {urllib.parse.quote(path, safe='/?=&')} HTTP/1.1\r\n"
+                f"Host: {self.host}\r\n"
+                f"Content-Length: {len(body)}\r\n\r\n")
+        self.writer.write(head.encode("latin-1") + body)
+        await self.writer.drain()
+        response = await self.reader.readuntil(b"\r\n\r\n")
+        status = int(response.split(b" ", 2)[1])
+        length = 0
+        for line in response.split(b"\r\n"):
+            if line.lower().startswith(b"content-length:"):
+                length = int(line.split(b":", 1)[1])
+        data = await self.reader.readexactly(length)
+        return status, data
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+async def run_client(client: Client, args, menu: str, items: list, deadline: float,
+                     latencies: dict, errors: list, rng: random.Random):
+    await client.connect()
+    try:
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            if roll < args.order_ratio:
+                kind = "order"
+                request = ("POST", "/orders", {"menu": menu, "items": rng.choices(items, k=args.order_size)})
+            elif roll < args.order_ratio + args.query_ratio:
+                kind = "query"
+                request = ("GET", f"/menus/{menu}/items?max_price={rng.randint(2, 15)}", None)
+            else:
+                kind = "menu"
+                request = ("GET", f"/menus/{menu}", None)
+            start = time.perf_counter()
+            status, data = await client.request(*request)
+            elapsed = time.perf_counter() - start
+            latencies[kind].append(elapsed)
+            if status >= 400:
+                errors.append(status)
+            elif kind == "order":
+                order_id = json.loads(data)["id"]
+                start = time.perf_counter()
+                status, _ = await client.request("POST", f"/orders/{order_id}/pay",
+                                                 {"method": "cash", "amount": 10_000})
+                latencies["pay"].append(time.perf_counter() - start)
+                if status >= 400:
+                    errors.append(status)
+    finally:
+        await client.close()
+
+async def run(args) -> dict:
+    probe = Client(args.host, args.port)
+    await probe.connect()
+    status, data = await probe.request("GET", f"/menus/{args.menu}")
+    await probe.close()
+    if status != 200:
+        raise SystemExit(f"Menu '{args.menu}' is not available: {data.decode('utf-8', 'replace')}")
+    items = list(json.loads(data)["items"])
+    latencies = {"menu": [], "query": [], "order": [], "pay": []}
+    errors = []
+    deadline = time.perf_counter() + args.duration
+    start = time.perf_counter()
+    await asyncio.gather(*(run_client(Client(args.host, args.port), args, args.menu, items, deadline,
+                                      latencies, errors, random.Random(args.seed + i))
+                           for i in range(args.clients)))
+    elapsed = time.perf_counter() - start
+    report = {"clients": args.clients, "seconds": elapsed, "errors": len(errors), "requests": {}}
+    total = 0
+    for kind, values in latencies.items():
+        values.sort()
+        total += len(values)
+        report["requests"][kind] = {"count": len(values),
+                                    "p50_ms": percentile(values, 0.50) * 1000,
+                                    "p99_ms": percentile(values, 0.99) * 1000}
+    everything = sorted(value for values in latencies.values() for value in values)
+    report["requests_per_second"] = total / elapsed
+    report["p50_ms"] = percentile(everything, 0.50) * 1000
+    report["p99_ms"] = percentile(everything, 0.99) * 1000
+    return report
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Generate load against the HTTP ordering service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--clients", type=int, default=200, help="concurrent keep-alive connections")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds to run")
+    parser.add_argument("--menu", default="Default Menu", help="menu to order from")
+    parser.add_argument("--order-size", type=int, default=5, help="items per order")
+    parser.add_argument("--order-ratio", type=float, default=0.3, help="share of requests placing orders")
+    parser.add_argument("--query-ratio", type=float, default=0.2, help="share of requests querying items")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+    report = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(report, indent=4))
+    else:
+        print(f"{report['clients']} clients, {report['requests_per_second']:.0f} requests/s, "
+              f"{report['errors']} errors")
+        print(f"all     p50 {report['p50_ms']:8.3f} ms   p99 {report['p99_ms']:8.3f} ms")
+        for kind, stats in report["requests"].items():
+            print(f"{kind:<7} p50 {stats['p50_ms']:8.3f} ms   p99 {stats['p99_ms']:8.3f} ms   ({stats['count']} requests)")
+    return 1 if report["errors"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
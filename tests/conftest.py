@@ -0,0 +1,26 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def load_restaurant():
+    if "restaurant" in sys.modules:
+        return sys.modules["restaurant"]
+    spec = importlib.util.spec_from_file_location("restaurant", os.path.join(ROOT, "Restaurant final.py"))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["restaurant"] = module
+    spec.loader.exec_module(module)
+    return module
+
+@pytest.fixture(scope="session")
+def restaurant():
+    return load_restaurant()
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # the app writes its files (spill, journal, logs) next to where it runs
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+def random_rules(restaurant, rng, n_rules):
+    counted = ("items",) + restaurant.PROMOTION_TARGETS[1:]
+    rules = []
+    for i in range(n_rules):
+        rule = {"name": f"rule {i}", "target": rng.choice(restaurant.PROMOTION_TARGETS),
+                "when": {name: rng.randint(0, 8) for name in rng.sample(counted, rng.randint(0, 2))},
+                "percent": rng.choice([5, 10, 12.5, 33.3, 50]), "priority": rng.randint(0, 3),
+                "stacking": rng.choice(restaurant.PROMOTION_STACKING)}
+        if rng.random() < 0.3:
+            rule.update(per_item=rng.choice([0.25, 0.5, 1]), per_item_after=rng.randint(0, 10))
+        if rng.random() < 0.5:
+            rule["cap"] = rng.choice([15, 30, 60])
+        rules.append(rule)
+    return rules
+
+def reference_percents(restaurant, rules, n, counts):
+    counted = dict(zip(restaurant.PROMOTION_TARGETS[1:], counts), items=n)
+    percents = []
+    for target in restaurant.PROMOTION_TARGETS:
+        total, fired = 0.0, False
+        for rule in sorted((rule for rule in rules if rule["target"] == target), key=lambda rule: -rule["priority"]):
+            if rule["stacking"] == "exclusive" and fired:
+                continue
+            if any(counted[name] < minimum for name, minimum in rule["when"].items()):
+                continue
+            percent = min(rule["cap"], rule["percent"] + rule["per_item"] * max(0, n - rule["per_item_after"]))
+            if rule["stacking"] == "exclusive":
+                total = percent
+                break
+            total += percent
+            fired = True
+        percents.append(min(total, 100.0))
+    return tuple(percents)
+
+def random_orders(restaurant, rng, n_orders):
+    items = list(restaurant.default.items.values())
+    return [restaurant.Order(rng.choices(items, k=rng.randint(1, 30))) for _ in range(n_orders)]
+
+@pytest.mark.parametrize("seed", range(3))
+def test_batch_billing_matches_get_bill(restaurant, monkeypatch, seed):
+    rng = random.Random(seed)
+    promotions = restaurant.PromotionEngine(random_rules(restaurant, rng, 10) + restaurant.DEFAULT_PROMOTIONS)
+    monkeypatch.setattr(restaurant.Order, "promotions", promotions)
+    orders = random_orders(restaurant, rng, 300)
+    expected = [order.get_bill_cents() for order in orders]
+    batch = restaurant.bill_orders(orders)
+    encoded = restaurant.bill_encoded(*restaurant.encode_orders(orders))
+    for discount1, discount2, totals in (batch[:3], encoded):
+        assert list(totals) == expected
+        assert list(discount1) == [order.discount1() for order in orders]
+        assert list(discount2) == [order.discount2() for order in orders]
+
+def test_batch_billing_of_no_orders(restaurant):
+    assert len(restaurant.bill_orders([]).totals_cents) == 0
+    assert len(restaurant.bill_encoded(*restaurant.encode_orders([]))[2]) == 0
+
+@pytest.mark.parametrize("seed", range(5))
+def test_compiled_promotions_match_reference(restaurant, seed):
+    rng = random.Random(seed)
+    engine = restaurant.PromotionEngine(random_rules(restaurant, rng, 40))
+    for _ in range(500):
+        n = rng.randint(0, 40)
+        counts = [rng.randint(0, n) for _ in restaurant.CATEGORIES]
+        assert engine.evaluate(n, *counts) == reference_percents(restaurant, engine.rules, n, counts)
+
+@pytest.mark.parametrize("field, value", [("percent", -20), ("percent", float("nan")), ("cap", float("nan")),
+                                          ("cap", float("inf")), ("per_item", -0.5)])
+def test_promotions_reject_invalid_amounts(restaurant, field, value):
+    rule = {"name": "Bad", "target": "order", "percent": 10, field: value}
+    with pytest.raises(ValueError):
+        restaurant.PromotionEngine([rule])
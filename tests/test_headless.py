@@ -0,0 +1,23 @@
+import asyncio
+import io
+import json
+
+import pytest
+
+def run_lines(restaurant, lines):
+    out = io.StringIO()
+    processed = asyncio.run(restaurant.process_order_stream(lines, out, [restaurant.default]))
+    return processed, [json.loads(line) for line in out.getvalue().splitlines()]
+
+def test_non_finite_cash_fails_only_its_line(restaurant):
+    order = '{{"id": {id}, "menu": "Default Menu", "items": ["Empanadas"], "payment": {{"method": "cash", "amount": {amount}}}}}'
+    lines = [order.format(id=1, amount='"nan"'), order.format(id=2, amount="NaN"),
+             order.format(id=3, amount="1e400"), order.format(id=4, amount=100)]
+    processed, results = run_lines(restaurant, lines)
+    assert processed == 4
+    assert [result["status"] for result in results] == ["error", "error", "error", "paid"]
+
+@pytest.mark.parametrize("amount", [float("nan"), float("inf"), "-inf", "NaN", "abc"])
+def test_to_cents_rejects_non_finite(restaurant, amount):
+    with pytest.raises(ValueError):
+        restaurant.to_cents(amount)
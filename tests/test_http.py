@@ -0,0 +1,74 @@
+import asyncio
+import json
+
+def request(service, method, path, body=None, query=None):
+    data = json.dumps(body).encode("utf-8") if body is not None else b""
+    return asyncio.run(service.handle(method, path, query or {}, data))
+
+def test_compaction_keeps_binary_snapshot(restaurant, workdir):
+    restaurant.export_menus_binary([restaurant.default], "menus.bin")
+    menus = restaurant.load_menus("menus.bin")
+    service = restaurant.OrderService(menus, restaurant.MenuLog(menus, "menus.bin", compact_every=3))
+    for i in range(4):
+        status, _ = request(service, "PUT", f"/menus/Default Menu/items/Special {i}",
+                            {"name": f"Special {i}", "price": 2.5 + i, "is_vegan": True, "type": "Dessert"})
+        assert status == 200
+    reloaded = restaurant.load_menus("menus.bin")
+    items = reloaded[0].items
+    assert isinstance(reloaded, restaurant.BinaryMenus)
+    assert all(f"Special {i}" in items for i in range(4))
+    assert items["Special 3"].price_cents == 550
+    assert items["Special 3"].is_vegan
+
+def test_concurrent_payments_settle_once(restaurant, monkeypatch):
+    monkeypatch.setattr(restaurant.default_processor, "latency", 0.05)
+    service = restaurant.OrderService([restaurant.default])
+    status, created = request(service, "POST", "/orders", {"menu": "Default Menu", "items": ["Empanadas"]})
+    assert status == 201
+    path = f"/orders/{created['id']}/pay"
+    body = json.dumps({"method": "card", "card_number": "4111111111111111", "cvv": "123"}).encode("utf-8")
+
+    async def pay_twice():
+        return await asyncio.gather(*(service.handle("POST", path, {}, body) for _ in range(2)),
+                                    return_exceptions=True)
+
+    results = asyncio.run(pay_twice())
+    assert results[0][0] == 200 and results[0][1]["status"] == "paid"
+    assert isinstance(results[1], restaurant.HTTPError) and results[1].status == 409
+    assert created["id"] not in service.orders
+
+def test_bad_item_body_is_rejected(restaurant):
+    menu = restaurant.Menu("Default Menu", dict(restaurant.default.items))
+    service = restaurant.OrderService([menu])
+    path = "/menus/Default Menu/items/Special"
+    for body in ({"name": "Special", "price": 3.0}, {"name": "Special", "type": "Dessert"},
+                 {"name": "Special", "price": "abc", "type": "Dessert"},
+                 {"name": "Special", "price": float("nan"), "type": "Dessert"},
+                 {"name": "Special", "price": 1, "type": "Beverage", "size": 5, "beverage_type": "x"},
+                 {"name": "Special", "price": 1, "type": "MainCourse", "protein": None,
+                  "grains": "Rice", "vegetables": "Salad"},
+                 {"name": 7, "price": 1, "type": "Dessert"}):
+        try:
+            request(service, "PUT", path, body)
+        except restaurant.HTTPError as error:
+            assert error.status == 400
+        else:
+            raise AssertionError(f"{body} was accepted")
+        assert "Special" not in menu.items
+
+def test_invalid_content_length_gets_a_response(restaurant):
+    service = restaurant.OrderService([restaurant.default])
+
+    async def exchange(length):
+        server = await asyncio.start_server(service.connection, "127.0.0.1", 0)
+        async with server:
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(f"POST /orders HTTP/1.1\r\nContent-Length: {length}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            response = await reader.read()
+            writer.close()
+            return response
+
+    for length in ("-1", "abc"):
+        assert asyncio.run(exchange(length)).startswith(b"HTTP/1.1 400 ")
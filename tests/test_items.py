@@ -0,0 +1,31 @@
+def test_bulk_update_matches_single_inserts(restaurant):
+    base = list(restaurant.default.items.values())
+    items = {f"Item {n}": base[n % len(base)].set_price((n * 37) % 50 + 0.5) for n in range(200)}
+    bulk = restaurant.IndexedItems(items)
+    single = restaurant.IndexedItems()
+    for key, item in items.items():
+        single[key] = item
+    changes = {"Item 3": base[0].set_price(1), "Item 500": base[1]}
+    bulk.update(changes)
+    for key, item in changes.items():
+        single[key] = item
+    assert bulk.by_price == single.by_price
+    assert bulk.by_vegan == single.by_vegan
+    assert bulk.by_category == single.by_category
+    assert bulk.query(min_price=5, max_price=20) == single.query(min_price=5, max_price=20)
+
+def test_failed_insert_leaves_items_unchanged(restaurant):
+    items = restaurant.IndexedItems(restaurant.default.items)
+    before = (dict(items), list(items.by_price), items.version)
+    broken = restaurant.Beverage("Broken", 1, 5, "Soda")
+    for change in (lambda: items.__setitem__("Broken", broken),
+                   lambda: items.__setitem__("Empanadas", broken),
+                   lambda: items.update({"Fine": restaurant.Dessert("Fine", 1), "Broken": broken})):
+        try:
+            change()
+        except AttributeError:
+            pass
+        else:
+            raise AssertionError("an item without a text size was indexed")
+        assert (dict(items), list(items.by_price), items.version) == before
+    del items["Empanadas"]
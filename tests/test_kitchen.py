@@ -0,0 +1,11 @@
+import json
+
+def test_bad_arrival_time_is_counted_as_an_error(restaurant, workdir):
+    restaurant.export_menus([restaurant.default], "menus.json")
+    order = {"menu": "Default Menu", "items": ["Empanadas"]}
+    with open("orders.jsonl", "w", encoding="utf-8") as f:
+        for at in (0, "x", None, float("nan"), 60):
+            f.write(json.dumps(dict(order, at=at)) + "\n")
+    report = restaurant.run_simulation("orders.jsonl", "menus.json")
+    assert report["orders"] == 2
+    assert report["errors"] == 3
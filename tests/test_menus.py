@@ -0,0 +1,73 @@
+def vegan_menu(restaurant):
+    items = dict(restaurant.default.items)
+    items["Empanadas"] = items["Empanadas"].set_is_vegan(True)
+    return restaurant.Menu("Default Menu", items)
+
+def as_dicts(menus):
+    return [(menu.name, {key: item.to_dict() for key, item in menu.items.items()}) for menu in menus]
+
+def test_json_binary_json_round_trip(restaurant, workdir):
+    menus = [vegan_menu(restaurant)]
+    restaurant.export_menus(menus, "menus.json")
+    restaurant.json_to_binary("menus.json", "menus.bin")
+    restaurant.binary_to_json("menus.bin", "copy.json")
+    assert as_dicts(restaurant.load_menus("menus.bin")) == as_dicts(menus)
+    assert as_dicts(restaurant.load_menus("copy.json")) == as_dicts(menus)
+
+def test_vegan_query_after_reload(restaurant, workdir):
+    restaurant.export_menus([vegan_menu(restaurant)], "menus.json")
+    restaurant.json_to_binary("menus.json", "menus.bin")
+    for filename in ("menus.json", "menus.bin"):
+        menu = restaurant.load_menus(filename)[0]
+        assert list(menu.query(vegan=True)) == ["Empanadas"]
+
+def test_lazy_menus_find_by_name(restaurant, workdir):
+    menus = [restaurant.default, restaurant.Menu("Lunch", dict(restaurant.default.items))]
+    restaurant.export_menus(menus, "menus.json")
+    lazy = restaurant.load_menus("menus.json", lazy=True)
+    assert isinstance(lazy, restaurant.LazyMenus)
+    assert restaurant.find_menu(lazy, "Lunch").name == "Lunch"
+    assert not lazy.is_loaded(0)
+    lazy.append(restaurant.Menu("Dinner", {}))
+    del lazy[0]
+    assert restaurant.find_menu(lazy, "Dinner") is lazy[1]
+    assert restaurant.find_menu(lazy, "Default Menu") is None
+
+def test_folded_log_is_not_replayed_after_a_crash(restaurant, workdir):
+    restaurant.export_menus([restaurant.default], "menus.json")
+    menus = restaurant.load_menus("menus.json")
+    log = restaurant.MenuLog(menus, "menus.json")
+    menu = menus[0]
+    original = menu.items["Empanadas"]
+    menu.items["Big Empanadas"] = menu.items.pop("Empanadas").set_name("Big Empanadas")
+    log.rename_item(menu.name, "Empanadas", "Big Empanadas")
+    menu.items["Empanadas"] = restaurant.Dessert("Empanadas", 2)
+    log.add_item(menu.name, "Empanadas", menu.items["Empanadas"])
+    # the crash: the snapshot is written, the log is never reset
+    restaurant.export_menus(menus, "menus.json")
+    for _ in range(2):
+        items = restaurant.load_menus("menus.json")[0].items
+        assert type(items["Big Empanadas"]) is type(original)
+        assert isinstance(items["Empanadas"], restaurant.Dessert)
+        restaurant.MenuLog(restaurant.load_menus("menus.json"), "menus.json")
+
+def test_log_replays_changes_after_the_snapshot(restaurant, workdir):
+    restaurant.export_menus([restaurant.default], "menus.json")
+    log = restaurant.MenuLog(restaurant.load_menus("menus.json"), "menus.json")
+    log.reprice_item("Default Menu", "Empanadas", 9)
+    with open("menus.json.log", "a", encoding="utf-8") as f:
+        f.write('{"op": "remove_it')
+    assert restaurant.load_menus("menus.json")[0].items["Empanadas"].price_cents == 900
+    log = restaurant.MenuLog(restaurant.load_menus("menus.json"), "menus.json")
+    log.remove_item("Default Menu", "Empanadas")
+    assert "Empanadas" not in restaurant.load_menus("menus.json")[0].items
+
+def test_binary_menus_release_their_map_before_rewrite(restaurant, workdir):
+    restaurant.export_menus_binary([vegan_menu(restaurant)], "menus.bin")
+    menus = restaurant.load_menus("menus.bin")
+    prices = list(menus.menu_prices(0))
+    restaurant.export_menus_binary(menus, "menus.bin")
+    assert menus.data is None
+    assert list(menus.menu_prices(0)) == prices
+    assert as_dicts(menus) == as_dicts([vegan_menu(restaurant)])
+    assert as_dicts(restaurant.load_menus("menus.bin")) == as_dicts([vegan_menu(restaurant)])
@@ -0,0 +1,53 @@
+import time
+
+def test_shutdown_keeps_every_served_mark(restaurant, workdir):
+    class SlowJournal(restaurant.OrderJournal):
+        def serve(self, payment):
+            time.sleep(0.02)  # a settled() callback still running when its future is done
+            return super().serve(payment)
+
+    items = list(restaurant.default.items.values())
+    pipeline = restaurant.OrderPipeline(capacity=10, workers=2, policy="block",
+                                        journal=SlowJournal("orders.journal"))
+    for i in range(5):
+        assert pipeline.submit(restaurant.Order(items[i:i + 2]), restaurant.CashPayment(1000))
+    pipeline.shutdown()
+    assert pipeline.stats()["served"] == 5
+    journal = restaurant.OrderJournal("orders.journal")
+    journal.close()
+    assert journal.recovered == []
+
+def test_queue_put_time_leaves_out_the_journal_wait(restaurant, workdir, monkeypatch):
+    class SlowJournal(restaurant.OrderJournal):
+        def wait(self, sequence):
+            time.sleep(0.05)  # a slow fsync
+            return super().wait(sequence)
+
+    monkeypatch.setattr(restaurant.metrics, "enabled", True)
+    restaurant.metrics.reset()
+    items = list(restaurant.default.items.values())
+    pipeline = restaurant.OrderPipeline(capacity=10, workers=1, policy="block",
+                                        journal=SlowJournal("orders.journal"))
+    for i in range(3):
+        pipeline.submit(restaurant.Order(items[i:i + 2]), restaurant.CashPayment(1000))
+    pipeline.shutdown()
+    _, put_seconds, puts = restaurant.metrics.histograms["queue_put_seconds"]
+    restaurant.metrics.reset()
+    assert puts == 3
+    assert put_seconds < 0.05
+
+def test_journal_recovers_unserved_orders(restaurant, workdir):
+    items = list(restaurant.default.items.values())
+    placed = [(restaurant.Order(items[i:i + 3]), restaurant.CashPayment(100)) for i in range(3)]
+    journal = restaurant.OrderJournal("orders.journal")
+    for order, payment in placed:
+        journal.wait(journal.place(order, payment))
+    journal.wait(journal.serve(placed[1][1]))
+    journal.close()
+    with open("orders.journal", "ab") as f:
+        f.write(b'{"op": "placed", "key": "torn')
+    recovered = restaurant.OrderJournal("orders.journal")
+    recovered.close()
+    assert [payment.key for _, payment in recovered.recovered] == [placed[0][1].key, placed[2][1].key]
+    assert [[item.name for item in order.items] for order, _ in recovered.recovered] == \
+           [[item.name for item in placed[i][0].items] for i in (0, 2)]
@@ -0,0 +1,34 @@
+import json
+
+def write_orders(lines):
+    with open("orders.jsonl", "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write(json.dumps(line) + "\n")
+
+def test_replay_loads_the_requested_menus(restaurant, workdir):
+    restaurant.export_menus([restaurant.default], "cheap.json")
+    items = dict(restaurant.default.items)
+    items["Empanadas"] = items["Empanadas"].set_price(100)
+    restaurant.export_menus([restaurant.Menu("Default Menu", items)], "dear.json")
+    write_orders([{"id": 1, "menu": "Default Menu", "items": ["Empanadas"]}])
+    cheap = restaurant.replay_sharded("orders.jsonl", "cheap.json", "none.json", processes=2)
+    dear = restaurant.replay_sharded("orders.jsonl", "dear.json", "none.json", processes=2)
+    assert cheap["gross_cents"] == restaurant.default.items["Empanadas"].price_cents
+    assert dear["gross_cents"] == 10000
+
+def test_replay_keeps_callers_promotions(restaurant, workdir):
+    restaurant.export_menus([restaurant.default], "menus.json")
+    write_orders([{"id": 1, "menu": "Default Menu", "items": ["Empanadas"]}])
+    promotions = restaurant.Order.promotions
+    restaurant.replay_sharded("orders.jsonl", "menus.json", "none.json", processes=2)
+    assert restaurant.Order.promotions is promotions
+    assert restaurant.replay_menus is None
+
+def test_replay_bills_orders_without_an_id(restaurant, workdir):
+    restaurant.export_menus([restaurant.default], "menus.json")
+    write_orders([{"menu": "Default Menu", "items": ["Empanadas"]} for _ in range(5)]
+                 + [{"id": 7, "menu": "Default Menu", "items": ["Nope"]}])
+    totals = restaurant.replay_sharded("orders.jsonl", "menus.json", "none.json", processes=3)
+    assert totals["orders"] == 5
+    assert totals["errors"] == 1
+    assert totals["items"] == 5